@@ -0,0 +1,99 @@
+import time
+from array import array
+from typing import Optional, Tuple
+
+# 小时桶和天桶的数量，即可查询的最长时间窗口
+HOURLY_BUCKETS = 48
+DAILY_BUCKETS = 30
+
+
+class ActivityCounter:
+    """群成员发言计数器
+
+    按小时和按天分别用定长数组做环形缓冲区，记录时只清零跨过的桶再累加当前桶，
+    存储空间固定，不随消息数增长。
+    """
+
+    __slots__ = ("last_hour", "last_day", "hourly", "daily")
+
+    def __init__(self, last_hour: int = 0, last_day: int = 0,
+                 hourly: Optional[array] = None, daily: Optional[array] = None):
+        self.last_hour = last_hour
+        self.last_day = last_day
+        self.hourly = hourly if hourly is not None else array('I', [0]) * HOURLY_BUCKETS
+        self.daily = daily if daily is not None else array('I', [0]) * DAILY_BUCKETS
+
+    @staticmethod
+    def _advance(buckets: array, last: int, now: int) -> int:
+        """把环形缓冲区推进到 now，清零中间跨过的桶，返回新的 last"""
+        gap = now - last
+        if gap <= 0:
+            return last
+        size = len(buckets)
+        if gap >= size:
+            for i in range(size):
+                buckets[i] = 0
+        else:
+            for index in range(last + 1, now + 1):
+                buckets[index % size] = 0
+        return now
+
+    @staticmethod
+    def _window_sum(buckets: array, last: int, now: int, width: int) -> int:
+        """统计截至 now 的最近 width 个桶的总数"""
+        size = len(buckets)
+        start = max(now - width + 1, last - size + 1)
+        end = min(now, last)
+        return sum(buckets[index % size] for index in range(start, end + 1))
+
+    def record(self, timestamp: Optional[float] = None, count: int = 1):
+        """记录发言"""
+        if timestamp is None:
+            timestamp = time.time()
+        hour = int(timestamp // 3600)
+        day = hour // 24
+
+        self.last_hour = self._advance(self.hourly, self.last_hour, hour)
+        self.last_day = self._advance(self.daily, self.last_day, day)
+        self.hourly[self.last_hour % HOURLY_BUCKETS] += count
+        self.daily[self.last_day % DAILY_BUCKETS] += count
+
+    def count_hours(self, hours: int, timestamp: Optional[float] = None) -> int:
+        """最近 hours 小时的发言数，最多 HOURLY_BUCKETS 小时"""
+        if timestamp is None:
+            timestamp = time.time()
+        now = int(timestamp // 3600)
+        return self._window_sum(self.hourly, self.last_hour, now, min(hours, HOURLY_BUCKETS))
+
+    def count_days(self, days: int, timestamp: Optional[float] = None) -> int:
+        """最近 days 天的发言数，最多 DAILY_BUCKETS 天"""
+        if timestamp is None:
+            timestamp = time.time()
+        now = int(timestamp // 86400)
+        return self._window_sum(self.daily, self.last_day, now, min(days, DAILY_BUCKETS))
+
+    def count(self, hours: int, timestamp: Optional[float] = None) -> int:
+        """最近 hours 小时的发言数，超出小时桶范围时按天桶统计"""
+        if hours <= HOURLY_BUCKETS:
+            return self.count_hours(hours, timestamp)
+        return self.count_days((hours + 23) // 24, timestamp)
+
+    def to_row(self) -> Tuple[int, int, bytes, bytes]:
+        """序列化为 (last_hour, last_day, hourly, daily)"""
+        return self.last_hour, self.last_day, self.hourly.tobytes(), self.daily.tobytes()
+
+    @classmethod
+    def from_row(cls, last_hour: int, last_day: int, hourly: bytes, daily: bytes) -> "ActivityCounter":
+        """从数据库行反序列化"""
+        hourly_buckets = array('I')
+        hourly_buckets.frombytes(hourly)
+        daily_buckets = array('I')
+        daily_buckets.frombytes(daily)
+        if len(hourly_buckets) != HOURLY_BUCKETS or len(daily_buckets) != DAILY_BUCKETS:
+            # 桶数量变化后旧数据无法对齐，直接重新计数
+            return cls()
+        return cls(last_hour, last_day, hourly_buckets, daily_buckets)
+
+    def nbytes(self) -> int:
+        """估算占用字节数"""
+        return (len(self.hourly) + len(self.daily)) * self.hourly.itemsize
@@ -0,0 +1,349 @@
+from astrbot.api import logger
+import asyncio
+import json
+import os
+import re
+import shutil
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional, Set, Tuple
+from .profile_store import ProfileStore
+
+# 镜像文件中记录写出代次的键，QQ号和群号都是数字，不会与之冲突
+GENERATION_KEY = "_generation"
+# 每个镜像文件保留的基准快照数，基于更早代次编辑的文件无法合并
+BASE_KEEP = 5
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+@contextmanager
+def atomic_write(path: str):
+    """先写临时文件，成功后再替换目标文件"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def file_stat(path: str) -> Optional[Tuple[int, int]]:
+    """文件的 (mtime_ns, size)，文件不存在时返回 None"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def iter_json_object(text: str) -> Iterator[Tuple[str, Any]]:
+    """逐项解析顶层 JSON 对象，产出 (键, 值)
+
+    json.loads 解析整个大文件时会一直持有 GIL，即使在后台线程中也会阻塞事件循环，
+    逐项解析则每次只解析一条记录。
+    """
+    decoder = json.JSONDecoder()
+    index = _WHITESPACE.match(text, 0).end()
+    if text[index:index + 1] != "{":
+        raise ValueError("顶层必须是对象")
+    index = _WHITESPACE.match(text, index + 1).end()
+    if text[index:index + 1] == "}":
+        index += 1
+    else:
+        while True:
+            key, index = decoder.raw_decode(text, index)
+            if not isinstance(key, str):
+                raise ValueError(f"第 {index} 个字符前的键不是字符串")
+            index = _WHITESPACE.match(text, index).end()
+            if text[index:index + 1] != ":":
+                raise ValueError(f"第 {index} 个字符处缺少冒号")
+            value, index = decoder.raw_decode(text, _WHITESPACE.match(text, index + 1).end())
+            yield key, value
+            index = _WHITESPACE.match(text, index).end()
+            char = text[index:index + 1]
+            index = _WHITESPACE.match(text, index + 1).end()
+            if char == "}":
+                break
+            if char != ",":
+                raise ValueError(f"第 {index} 个字符附近缺少逗号")
+    if _WHITESPACE.match(text, index).end() != len(text):
+        raise ValueError("顶层对象之后有多余内容")
+
+
+def read_json_object(path: str) -> Dict[str, Any]:
+    """逐项解析 JSON 文件的顶层对象"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return dict(iter_json_object(f.read()))
+
+
+class JsonMirror:
+    """user_info.json / group_info.json 的可手动编辑镜像
+
+    数据变更后按间隔在后台线程中用独立的数据库连接把内容流式写出到这两个文件。
+    每次写出分配一个新的代次，写在文件的 "_generation" 键中，并在 mirror_base 目录下保留该代次内容的基准快照。
+
+    轮询发现文件的 mtime/size 变化时，与文件所基于代次的基准快照逐字段比较，只把管理员实际改动的字段
+    合并到数据库的当前记录上。因此用旧的编辑缓冲区保存、或只改了一个字段时，不会把其他记录或字段回退成旧值。
+    找不到对应基准快照的文件无法判断改动了什么，会另存为 .rejected 文件后重新写出。
+
+    从文件中删除的记录不会从数据库删除，请使用 azusaimp delete_user 命令删除用户。
+    """
+
+    def __init__(self, store: ProfileStore, user_file: str, group_file: str):
+        """
+        Args:
+            store: 信息存储
+            user_file: 用户信息文件路径
+            group_file: 群信息文件路径
+        """
+        self.store = store
+        self.user_file = user_file
+        self.group_file = group_file
+        self.base_dir = os.path.join(os.path.dirname(user_file), "mirror_base")
+        # 待写出的文件，启动后两个文件都先写出一次
+        self.dirty: Set[str] = {user_file, group_file}
+        self.last_flush = 0.0
+
+        # 文件路径 -> 上次写出或合并后的 (mtime_ns, size)
+        self._file_stats: Dict[str, Optional[Tuple[int, int]]] = {}
+        # 解析失败的文件，在被修正前不覆盖写出，以免丢掉管理员正在进行的编辑
+        self._broken = set()
+
+        store.add_listener(self._on_store_change)
+
+    def _on_store_change(self, kind: str, group_id: str, qq_number: str):
+        if kind == "user":
+            self.dirty.add(self.user_file)
+        elif kind in ("member", "group"):
+            self.dirty.add(self.group_file)
+        elif kind != "activity":
+            self.dirty.update((self.user_file, self.group_file))
+
+    def _base_path(self, path: str, generation: int) -> str:
+        name, ext = os.path.splitext(os.path.basename(path))
+        return os.path.join(self.base_dir, f"{name}.{generation}{ext}")
+
+    def _list_bases(self, path: str) -> List[Tuple[int, str]]:
+        """列出某个镜像文件的基准快照，按代次升序"""
+        if not os.path.isdir(self.base_dir):
+            return []
+        name, ext = os.path.splitext(os.path.basename(path))
+        pattern = re.compile(rf"{re.escape(name)}\.(\d+){re.escape(ext)}$")
+        bases = []
+        for file_name in os.listdir(self.base_dir):
+            match = pattern.match(file_name)
+            if match:
+                bases.append((int(match.group(1)), os.path.join(self.base_dir, file_name)))
+        return sorted(bases)
+
+    @staticmethod
+    def _iter_records(data: Dict[str, Any], is_user: bool):
+        """遍历文件内容中的记录，产出 (记录键, 记录)，用户记录键为 qq_number，群成员记录键为 (group_id, qq_number)"""
+        if is_user:
+            for qq_number, record in data.items():
+                if isinstance(record, dict):
+                    yield str(qq_number), record
+        else:
+            for group_id, members in data.items():
+                if not isinstance(members, dict):
+                    continue
+                for qq_number, record in members.items():
+                    if isinstance(record, dict):
+                        yield (str(group_id), str(qq_number)), record
+
+    # ---------- 合并外部修改 ----------
+
+    async def check(self) -> int:
+        """检查文件是否被外部修改，只比较 mtime/size，有变化时合并改动过的字段
+
+        Returns:
+            int: 合并的记录数
+        """
+        merged = 0
+        for path in (self.user_file, self.group_file):
+            stat = file_stat(path)
+            if stat == self._file_stats.get(path):
+                continue
+            self._file_stats[path] = stat
+            if stat is None:
+                # 文件被删除，重新写出
+                self.dirty.add(path)
+                continue
+            merged += await self._merge(path)
+        return merged
+
+    async def _merge(self, path: str) -> int:
+        if self.store.get_meta("mirror_generation") is None:
+            # 尚未写出过镜像，现有文件是已导入数据库的旧版信息文件
+            return 0
+
+        is_user = path == self.user_file
+        try:
+            result = await asyncio.to_thread(self._diff_file, path, is_user)
+        except Exception as e:
+            if path not in self._broken:
+                logger.error(f"解析 {path} 失败，修正前不会覆盖该文件: {e}")
+            self._broken.add(path)
+            return 0
+        self._broken.discard(path)
+
+        if result is None:
+            rejected_path = f"{path}.rejected"
+            os.replace(path, rejected_path)
+            self._file_stats.pop(path, None)
+            self.dirty.add(path)
+            logger.warning(
+                f"{path} 不是基于最近写出的内容编辑的，无法判断改动了哪些内容，"
+                f"已另存为 {rejected_path}，请在重新写出的文件上再次修改"
+            )
+            return 0
+
+        base_path, data, changes = result
+        if not changes:
+            return 0
+
+        with self.store.transaction():
+            for key, fields, removed in changes:
+                if is_user:
+                    record = self.store.get_user(key) or {}
+                else:
+                    record = self.store.get_member(key[0], key[1]) or {}
+                record.update(fields)
+                for field in removed:
+                    record.pop(field, None)
+                if is_user:
+                    self.store.put_user(key, record)
+                else:
+                    self.store.put_member(key[0], key[1], record)
+        logger.info(f"检测到 {path} 被外部修改，已合并 {len(changes)} 条记录")
+
+        # 已合并的内容作为该代次新的基准，同一个编辑缓冲区再次保存时只合并新的改动
+        await asyncio.to_thread(self._write_base, base_path, data)
+        return len(changes)
+
+    def _diff_file(self, path: str, is_user: bool) -> Optional[Tuple[str, Dict[str, Any], List[Tuple[Any, Dict[str, Any], List[str]]]]]:
+        """在后台线程中与基准快照逐字段比较
+
+        Returns:
+            tuple: (基准快照路径, 文件内容, [(记录键, 改动的字段, 删除的字段), ...])，找不到基准快照时返回 None
+        """
+        data = read_json_object(path)
+        generation = data.get(GENERATION_KEY)
+        if not isinstance(generation, int):
+            return None
+        base_path = self._base_path(path, generation)
+        if not os.path.exists(base_path):
+            return None
+        base_records = dict(self._iter_records(read_json_object(base_path), is_user))
+
+        changes = []
+        for key, record in self._iter_records(data, is_user):
+            base_record = base_records.get(key)
+            if record == base_record:
+                continue
+            if base_record is None:
+                changes.append((key, record, []))
+                continue
+            fields = {
+                field: value for field, value in record.items()
+                if field not in base_record or base_record[field] != value
+            }
+            removed = [field for field in base_record if field not in record]
+            changes.append((key, fields, removed))
+        return base_path, data, changes
+
+    @staticmethod
+    def _write_base(base_path: str, data: Dict[str, Any]):
+        with atomic_write(base_path) as f:
+            f.write("{")
+            for i, (key, value) in enumerate(data.items()):
+                f.write(f"{',' if i else ''}\n{json.dumps(key)}: {json.dumps(value, ensure_ascii=False)}")
+            f.write("\n}")
+
+    # ---------- 写出 ----------
+
+    async def flush(self, force: bool = False):
+        """在后台线程中把数据库内容写出到镜像文件，不阻塞事件循环，只写出有变更的文件
+
+        Args:
+            force: 是否不论有无变更都写出两个文件
+        """
+        paths = [
+            path for path in (self.user_file, self.group_file)
+            if (force or path in self.dirty) and path not in self._broken
+        ]
+        if not paths:
+            return
+        self.dirty.difference_update(paths)
+        self.last_flush = time.time()
+
+        with self.store.transaction():
+            generation = int(self.store.get_meta("mirror_generation") or 0) + 1
+            self.store.set_meta("mirror_generation", str(generation))
+
+        expected_stats = {path: self._file_stats.get(path) for path in paths}
+        try:
+            written = await asyncio.to_thread(self._write_files, generation, expected_stats)
+        except Exception:
+            self.dirty.update(paths)
+            raise
+        self._file_stats.update(written)
+        # 写出期间被外部修改的文件，等下一轮合并后再写出
+        self.dirty.update(path for path in paths if path not in written)
+
+    def _write_files(self, generation: int, expected_stats: Dict[str, Optional[Tuple[int, int]]]) -> Dict[str, Optional[Tuple[int, int]]]:
+        """在后台线程中从同一个数据库快照写出基准快照和镜像文件
+
+        Args:
+            expected_stats: 要写出的文件 -> 上次写出或合并后的 (mtime_ns, size)，文件已被再次修改时不覆盖
+
+        Returns:
+            dict: 实际写出的文件 -> 写出后的 (mtime_ns, size)
+        """
+        os.makedirs(self.base_dir, exist_ok=True)
+        written = {}
+        with self.store.read_snapshot() as conn:
+            for path, expected_stat in expected_stats.items():
+                base_path = self._base_path(path, generation)
+                with atomic_write(base_path) as f:
+                    if path == self.user_file:
+                        self._write_users(f, conn, generation)
+                    else:
+                        self._write_members(f, conn, generation)
+
+                if file_stat(path) != expected_stat:
+                    continue
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                shutil.copyfile(base_path, tmp_path)
+                os.replace(tmp_path, path)
+                written[path] = file_stat(path)
+
+                for _, old_base_path in self._list_bases(path)[:-BASE_KEEP]:
+                    os.remove(old_base_path)
+        return written
+
+    def _write_users(self, f, conn: sqlite3.Connection, generation: int):
+        f.write(f"{{\n  {json.dumps(GENERATION_KEY)}: {generation}")
+        for qq_number, data in self.store.iter_user_rows(conn):
+            text = json.dumps(json.loads(data), ensure_ascii=False, indent=2).replace("\n", "\n  ")
+            f.write(f",\n  {json.dumps(qq_number)}: {text}")
+        f.write("\n}")
+
+    def _write_members(self, f, conn: sqlite3.Connection, generation: int):
+        f.write(f"{{\n  {json.dumps(GENERATION_KEY)}: {generation}")
+        current_group = None
+        for group_id, qq_number, data in self.store.iter_member_rows(conn):
+            text = json.dumps(json.loads(data), ensure_ascii=False, indent=2).replace("\n", "\n    ")
+            if group_id != current_group:
+                if current_group is not None:
+                    f.write("\n  }")
+                f.write(f",\n  {json.dumps(group_id)}: {{\n    {json.dumps(qq_number)}: {text}")
+                current_group = group_id
+            else:
+                f.write(f",\n    {json.dumps(qq_number)}: {text}")
+        f.write("\n  }\n}" if current_group is not None else "\n}")
@@ -2,12 +2,16 @@ from astrbot.api.event import filter, AstrMessageEvent, MessageEventResult
 from astrbot.api.star import Context, Star, register
 from astrbot.api import logger, AstrBotConfig
 from astrbot.api.provider import ProviderRequest, LLMResponse
+import astrbot.api.message_components as Comp
+import asyncio
 import json
 import time
 import os
 import re
-from typing import Dict, Any, List
-from datetime import datetime
+from typing import Dict, Any, List, Set
+from datetime import datetime, timedelta
+from .profile_store import ProfileStore
+from .json_mirror import JsonMirror
 
 @register("AzusaImp", 
           "有栖日和", 
@@ -22,49 +26,42 @@ class AzusaImp(Star):
         self.group_info_file = "data/plugin_data/AzusaImp/group_info.json"
         self.ensure_data_directory()
         self.config = config
+        self.store = ProfileStore(
+            os.path.dirname(self.user_info_file),
+            max_records=self.config.get("cache_max_records", 2000),
+            max_bytes=self.config.get("cache_max_bytes", 0),
+            shared=self.config.get("shared_store", False),
+            member_touch_interval=self.config.get("member_touch_interval_minutes", 60) * 60
+        )
         self.placeholder_pattern = re.compile(r'\[User ID: (\d+), Nickname: ([^\]]+)\]')
+        # 按机器人QQ号记录协议端客户端及经由该客户端见到的群，供后台维护任务拉取群列表和成员列表
+        # 见到的群持久化在数据库中，重启后仍能清理重启前就已退出的群
+        self._qq_clients: Dict[str, Any] = {}
+        self._client_groups: Dict[str, Set[str]] = self.load_client_groups()
+        # 群成员摘要缓存: group_id -> {"members": {qq_number: 序列化后的摘要}, "dirty": 待重新渲染的成员, "members_json": 序列化结果, "built_at": 构建时间}
+        self._roster_digests: Dict[str, Dict[str, Any]] = {}
+        self.store.add_listener(self.on_store_change)
+        self._maintenance_task = asyncio.create_task(self._maintenance_loop())
+        self._activity_flush_task = asyncio.create_task(self._activity_flush_loop())
+        # user_info.json / group_info.json 作为可手动编辑的镜像，按 mtime/size 轮询外部修改，读写文件都在后台线程中进行
+        self.json_mirror = None
+        self._hot_reload_task = None
+        if self.config.get("enable_json_mirror", False):
+            self.json_mirror = JsonMirror(self.store, self.user_info_file, self.group_info_file)
+            self._hot_reload_task = asyncio.create_task(self._hot_reload_loop())
+        # 印象整理任务: 低优先级队列，由固定数量的工作协程消费以限制并发
+        self._consolidation_queue: asyncio.Queue = asyncio.Queue(maxsize=self.config.get("consolidation_queue_size", 100))
+        self._consolidation_pending = set()
+        self._consolidation_tasks = [asyncio.create_task(self._consolidation_loop())] + [
+            asyncio.create_task(self._consolidation_worker())
+            for _ in range(max(self.config.get("consolidation_concurrency", 1), 1))
+        ]
 
     def ensure_data_directory(self):
         """确保data目录存在"""
         os.makedirs(os.path.dirname(self.user_info_file), exist_ok=True)
         os.makedirs(os.path.dirname(self.group_info_file), exist_ok=True)
 
-    def load_user_info(self) -> Dict[str, Any]:
-        """加载用户信息文件"""
-        try:
-            if os.path.exists(self.user_info_file):
-                with open(self.user_info_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except Exception as e:
-            logger.error(f"加载用户信息文件失败: {e}")
-        return {}
-
-    def load_group_info(self) -> Dict[str, Any]:
-        """加载群信息文件"""
-        try:
-            if os.path.exists(self.group_info_file):
-                with open(self.group_info_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except Exception as e:
-            logger.error(f"加载群信息文件失败: {e}")
-        return {}
-
-    def save_user_info(self, user_info: Dict[str, Any]):
-        """保存用户信息到文件"""
-        try:
-            with open(self.user_info_file, 'w', encoding='utf-8') as f:
-                json.dump(user_info, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logger.error(f"保存用户信息文件失败: {e}")
-
-    def save_group_info(self, group_info: Dict[str, Any]):
-        """保存群信息到文件"""
-        try:
-            with open(self.group_info_file, 'w', encoding='utf-8') as f:
-                json.dump(group_info, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logger.error(f"保存群信息文件失败: {e}")
-
     def set_default_user_impression(self, user_info: Dict[str, Any], is_group: bool = False) -> Dict[str, Any]:
         """设置默认用户印象"""
         nickname = user_info["nickname"]
@@ -333,6 +330,66 @@ class AzusaImp(Star):
     
         return "，".join(prompt_parts)
     
+    def extract_mentioned_ids(self, event: AstrMessageEvent, req: ProviderRequest) -> List[str]:
+        """从消息链中的@和文本中的用户占位符收集被提及的QQ号（去重、保持顺序）"""
+        mentioned = []
+        
+        # 消息链中的@
+        for component in event.message_obj.message or []:
+            if isinstance(component, Comp.At):
+                mentioned.append(str(component.qq))
+        
+        # 文本中的 [User ID: ..., Nickname: ...] 占位符
+        for text in (event.message_str, req.prompt):
+            if text:
+                mentioned.extend(match.group(1) for match in self.placeholder_pattern.finditer(text))
+        
+        # 排除发送者自己、bot自己和@全体成员
+        excluded = {str(event.get_sender_id()), str(event.get_self_id()), "all"}
+        return [qq_number for qq_number in dict.fromkeys(mentioned) if qq_number not in excluded]
+
+    def format_mentioned_users_for_prompt(self, group_id: str, qq_numbers: List[str]) -> str:
+        """批量查询被提及用户的信息并格式化为提示词，每人的摘要有长度上限"""
+        max_users = self.config.get("mention_context_max_users", 5)
+        max_chars = self.config.get("mention_context_max_chars", 120)
+        qq_numbers = qq_numbers[:max_users]
+        if not qq_numbers:
+            return ""
+        
+        users = self.store.get_users(qq_numbers)
+        members = self.store.get_members(group_id, qq_numbers) if group_id else {}
+        
+        lines = []
+        for qq_number in qq_numbers:
+            user_data = users.get(qq_number)
+            member_data = members.get(qq_number, {})
+            if user_data is None and not member_data:
+                continue
+            user_data = user_data or {}
+            
+            parts = [f"QQ号: {qq_number}"]
+            nickname = user_data.get('nickname')
+            if nickname:
+                parts.append(f"昵称: {nickname}")
+            display_name = member_data.get('display_name')
+            if display_name and display_name != nickname:
+                parts.append(f"群昵称: {display_name}")
+            if user_data.get('address'):
+                parts.append(f"你对ta的称呼: {user_data['address']}")
+            if user_data.get('relationship'):
+                parts.append(f"关系: {user_data['relationship']}")
+            if user_data.get('impression'):
+                parts.append(f"印象: {user_data['impression']}")
+            if user_data.get('attitude'):
+                parts.append(f"态度: {user_data['attitude']}")
+            
+            summary = "，".join(parts)
+            if len(summary) > max_chars:
+                summary = summary[:max_chars - 1] + "…"
+            lines.append(f"- {summary}")
+        
+        return "\n".join(lines)
+
     @filter.on_llm_request()
     async def on_llm_request_hook(self, event: AstrMessageEvent, req: ProviderRequest):
         """LLM请求时的钩子，用于记录用户信息并添加到提示词"""
@@ -344,34 +401,33 @@ class AzusaImp(Star):
             qq_number = event.get_sender_id()
             group_id = event.get_group_id()
             is_group = bool(group_id)
-            
-            # 加载现有信息
-            all_user_info = self.load_user_info()
-            all_group_info = self.load_group_info()
-            
+
+            if hasattr(event, "bot"):
+                self_id = str(event.get_self_id())
+                self._qq_clients[self_id] = event.bot
+                if is_group:
+                    self.remember_client_group(self_id, str(group_id))
+            
+            # 加载现有信息，冷数据会从磁盘层按需读回
+            user_data = self.store.get_user(qq_number)
+
             # 如果用户基本信息不存在，则获取并保存
-            if qq_number not in all_user_info:
-                user_info = await self.get_qq_user_info(event, qq_number, update_user_info=True)
-                all_user_info[qq_number] = user_info
-                self.save_user_info(all_user_info)
+            if user_data is None:
+                user_data = await self.get_qq_user_info(event, qq_number, update_user_info=True)
+                self.store.put_user(qq_number, user_data)
                 logger.info(f"已记录新用户基本信息: QQ{qq_number}")
-            
+
+            current_group_info = {}
             # 如果是群聊，获取并保存群成员信息
             if is_group:
-                # 确保群ID键存在
-                if group_id not in all_group_info:
-                    all_group_info[group_id] = {}
-                
-                # 获取群成员信息
-                group_member_info = await self.get_group_member_info(event, qq_number)
-                all_group_info[group_id][qq_number] = group_member_info
-                self.save_group_info(all_group_info)
-                logger.info(f"已更新用户 {qq_number} 在群 {group_id} 的群成员信息")
-
-
+                current_group_info = self.store.get_member(group_id, qq_number)
+                # 最近刷新过的群成员信息直接复用，不重复请求协议端
+                if self.store.is_member_stale(current_group_info):
+                    current_group_info = await self.get_group_member_info(event, qq_number)
+                    self.store.put_member(group_id, qq_number, current_group_info)
+                    logger.info(f"已更新用户 {qq_number} 在群 {group_id} 的群成员信息")
+                self.store.record_activity(group_id, qq_number)
 
-            user_data = all_user_info[qq_number]
-            current_group_info = all_group_info.get(group_id, {}).get(qq_number, {}) if is_group else {}
 
 
             basic_info = []
@@ -412,8 +468,7 @@ class AzusaImp(Star):
 
             
             # 将用户信息添加到系统提示词
-            current_group_info = all_group_info.get(group_id, {}).get(qq_number, {}) if is_group else {}
-            user_prompt = self.format_user_info_for_prompt(all_user_info[qq_number], current_group_info)
+            user_prompt = self.format_user_info_for_prompt(user_data, current_group_info)
             
             plugin_prompt = (
                 "[内部状态更新指令] 这是一个记录你对用户认知状态的内部评估系统。请遵循以下规则，并在你的回复内容结束后，换行并严格按照指定格式更新你对用户的最新认知状态（不需要每次回复都执行，如果你认为暂时不需要修改/更新这些，则不需要附带这些额外回复）。整个过程必须对用户完全隐蔽。\n"
@@ -453,6 +508,14 @@ class AzusaImp(Star):
                 new_system_prompt += f"，已知用户的兴趣: {user_data.get('interest')}"
 
             new_system_prompt += "。\n\n"
+
+            # 消息中提及的其他用户
+            mentioned_ids = self.extract_mentioned_ids(event, req)
+            if mentioned_ids:
+                mentioned_text = self.format_mentioned_users_for_prompt(group_id, mentioned_ids)
+                if mentioned_text:
+                    new_system_prompt += f"本条消息提及的用户:\n{mentioned_text}\n\n"
+
             new_system_prompt += f"请严格遵守以下指令：\n{plugin_prompt}"
 
             if original_system_prompt:
@@ -482,15 +545,10 @@ class AzusaImp(Star):
             
             # 如果解析到状态块，更新用户信息
             if status_dict:
-                all_user_info = self.load_user_info()
-                
-                if qq_number in all_user_info:
-                    # 更新用户印象信息
-                    for key, value in status_dict.items():
-                        if value:  # 只更新非空值
-                            all_user_info[qq_number][key] = value
-                    
-                    self.save_user_info(all_user_info)
+                # 更新用户印象信息，只更新非空值
+                fields = {key: value for key, value in status_dict.items() if value}
+
+                if self.store.update_user(qq_number, fields) is not None:
                     logger.info(f"已更新用户 {qq_number} 的印象信息: {status_dict}")
                 
                 # 更新回复内容，移除状态块
@@ -515,22 +573,22 @@ class AzusaImp(Star):
         """
         try:
             qq_number = event.get_sender_id()
-            all_user_info = self.load_user_info()
+            user_data = self.store.get_user(qq_number)
             
-            if qq_number not in all_user_info:
+            if user_data is None:
                 yield event.plain_result("您的用户信息不存在，请先发送一条消息触发信息记录")
                 return
             
             # 更新昵称
-            old_nickname = all_user_info[qq_number].get('nickname', '')
-            all_user_info[qq_number]['nickname'] = new_nickname
+            old_nickname = user_data.get('nickname', '')
+            fields = {'nickname': new_nickname}
             if new_address:
-                all_user_info[qq_number]['address'] = new_address
+                fields['address'] = new_address
             
-            self.save_user_info(all_user_info)
+            user_data = self.store.update_user(qq_number, fields)
             
             logger.info(f"用户 {qq_number} 更新昵称: {old_nickname} -> {new_nickname}")
-            yield event.plain_result(f"已更新您的昵称: {new_nickname}，称呼：{all_user_info[qq_number]['address']}")
+            yield event.plain_result(f"已更新您的昵称: {new_nickname}，称呼：{user_data['address']}")
             
         except Exception as e:
             logger.error(f"更新昵称时出错: {e}")
@@ -545,9 +603,9 @@ class AzusaImp(Star):
         """
         try:
             qq_number = event.get_sender_id()
-            all_user_info = self.load_user_info()
+            user_data = self.store.get_user(qq_number)
             
-            if qq_number not in all_user_info:
+            if user_data is None:
                 yield event.plain_result("您的用户信息不存在，请先发送一条消息触发信息记录")
                 return
             
@@ -569,10 +627,8 @@ class AzusaImp(Star):
                 return
             
             # 更新生日
-            old_birthday = all_user_info[qq_number].get('birthday', '')
-            all_user_info[qq_number]['birthday'] = new_birthday
-            
-            self.save_user_info(all_user_info)
+            old_birthday = user_data.get('birthday', '')
+            self.store.update_user(qq_number, {'birthday': new_birthday})
             
             logger.info(f"用户 {qq_number} 更新生日: {old_birthday} -> {new_birthday}")
             yield event.plain_result(f"已更新您的生日: {new_birthday}")
@@ -590,9 +646,9 @@ class AzusaImp(Star):
         """
         try:
             qq_number = event.get_sender_id()
-            all_user_info = self.load_user_info()
+            user_data = self.store.get_user(qq_number)
             
-            if qq_number not in all_user_info:
+            if user_data is None:
                 yield event.plain_result("您的用户信息不存在，请先发送一条消息触发信息记录")
                 return
             
@@ -603,10 +659,8 @@ class AzusaImp(Star):
                 return
             
             # 更新性别
-            old_gender = all_user_info[qq_number].get('gender', '')
-            all_user_info[qq_number]['gender'] = new_gender
-            
-            self.save_user_info(all_user_info)
+            old_gender = user_data.get('gender', '')
+            self.store.update_user(qq_number, {'gender': new_gender})
             
             logger.info(f"用户 {qq_number} 更新性别: {old_gender} -> {new_gender}")
             yield event.plain_result(f"已更新您的性别: {new_gender}")
@@ -628,17 +682,15 @@ class AzusaImp(Star):
             if not qq_number:
                 qq_number = event.get_sender_id()
             
-            all_user_info = self.load_user_info()
+            user_data = self.store.get_user(qq_number)
             
-            if qq_number not in all_user_info:
+            if user_data is None:
                 yield event.plain_result("用户信息不存在，请先发送一条消息触发信息记录")
                 return
             
             # 更新关系
-            old_relationship = all_user_info[qq_number].get('relationship', '')
-            all_user_info[qq_number]['relationship'] = new_relationship
-            
-            self.save_user_info(all_user_info)
+            old_relationship = user_data.get('relationship', '')
+            self.store.update_user(qq_number, {'relationship': new_relationship})
             
             logger.info(f"管理员更新用户 {qq_number} 关系: {old_relationship} -> {new_relationship}")
             yield event.plain_result(f"已更新用户 {qq_number} 的关系: {new_relationship}")
@@ -660,17 +712,15 @@ class AzusaImp(Star):
             if not qq_number:
                 qq_number = event.get_sender_id()
             
-            all_user_info = self.load_user_info()
+            user_data = self.store.get_user(qq_number)
             
-            if qq_number not in all_user_info:
+            if user_data is None:
                 yield event.plain_result("用户信息不存在，请先发送一条消息触发信息记录")
                 return
             
             # 更新印象
-            old_impression = all_user_info[qq_number].get('impression', '')
-            all_user_info[qq_number]['impression'] = new_impression
-            
-            self.save_user_info(all_user_info)
+            old_impression = user_data.get('impression', '')
+            self.store.update_user(qq_number, {'impression': new_impression})
             
             logger.info(f"管理员更新用户 {qq_number} 印象: {old_impression} -> {new_impression}")
             yield event.plain_result(f"已更新用户 {qq_number} 的印象: {new_impression}")
@@ -692,17 +742,15 @@ class AzusaImp(Star):
             if not qq_number:
                 qq_number = event.get_sender_id()
             
-            all_user_info = self.load_user_info()
+            user_data = self.store.get_user(qq_number)
             
-            if qq_number not in all_user_info:
+            if user_data is None:
                 yield event.plain_result("用户信息不存在，请先发送一条消息触发信息记录")
                 return
             
             # 更新态度
-            old_attitude = all_user_info[qq_number].get('attitude', '')
-            all_user_info[qq_number]['attitude'] = new_attitude
-            
-            self.save_user_info(all_user_info)
+            old_attitude = user_data.get('attitude', '')
+            self.store.update_user(qq_number, {'attitude': new_attitude})
             
             logger.info(f"管理员更新用户 {qq_number} 态度: {old_attitude} -> {new_attitude}")
             yield event.plain_result(f"已更新用户 {qq_number} 的态度: {new_attitude}")
@@ -724,17 +772,15 @@ class AzusaImp(Star):
             if not qq_number:
                 qq_number = event.get_sender_id()
             
-            all_user_info = self.load_user_info()
+            user_data = self.store.get_user(qq_number)
             
-            if qq_number not in all_user_info:
+            if user_data is None:
                 yield event.plain_result("用户信息不存在，请先发送一条消息触发信息记录")
                 return
             
             # 更新爱好
-            old_interest = all_user_info[qq_number].get('interest', '')
-            all_user_info[qq_number]['interest'] = new_interest
-            
-            self.save_user_info(all_user_info)
+            old_interest = user_data.get('interest', '')
+            self.store.update_user(qq_number, {'interest': new_interest})
             
             logger.info(f"管理员更新用户 {qq_number} 爱好: {old_interest} -> {new_interest}")
             yield event.plain_result(f"已更新用户 {qq_number} 的爱好: {new_interest}")
@@ -754,13 +800,12 @@ class AzusaImp(Star):
         try:
             if not qq_number:
                 qq_number = event.get_sender_id()
-            all_user_info = self.load_user_info()
+            user_info = self.store.get_user(qq_number)
             
-            if qq_number not in all_user_info:
+            if user_info is None:
                 yield event.plain_result("用户信息不存在，请先发送一条消息触发信息记录")
                 return
             
-            user_info = all_user_info[qq_number]
             info_text = f"用户信息:\nQQ: {user_info.get('qq_number', '未知')}\n昵称: {user_info.get('nickname', '未知')} as {user_info.get('address', '未知')}\n性别: {user_info.get('gender', '未知')}\n生日: {user_info.get('birthday', '未知')}\n关系: {user_info.get('relationship', '未知')}\n印象: {user_info.get('impression', '未知')}\n态度: {user_info.get('attitude', '未知')}\n爱好: {user_info.get('interest', '未知')}"
             
             # 计算并显示年龄
@@ -788,11 +833,11 @@ class AzusaImp(Star):
             if not qq_number:
                 qq_number = event.get_sender_id()
             
-            all_user_info = self.load_user_info()
-            
             user_info = await self.get_qq_user_info(event, qq_number, update_user_info=True)
-            all_user_info[qq_number] = user_info
-            self.save_user_info(all_user_info)
+            self.store.put_user(qq_number, user_info)
+
+            # 群成员信息在用户下次发言时重新获取，只触及该用户所在的群，发言计数保留
+            self.store.delete_user_memberships(qq_number, keep_activity=True)
             
             yield event.plain_result("重置成功")
             
@@ -800,6 +845,381 @@ class AzusaImp(Star):
             logger.error(f"重置用户信息时出错: {e}")
             yield event.plain_result(f"获取信息失败: {str(e)}")
 
+    @azusaimp_command_group.command("delete_user")
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    async def delete_user_info(self, event: AstrMessageEvent, qq_number: str):
+        """删除用户信息及其在各群的成员信息和发言计数（管理员）
+        
+        Args:
+            qq_number(str): 删除对象QQ号
+        """
+        try:
+            group_count = len(self.store.get_user_groups(qq_number))
+            self.store.delete_user(qq_number)
+
+            logger.info(f"已删除用户 {qq_number} 的信息及 {group_count} 条群成员信息")
+            yield event.plain_result(f"已删除用户 {qq_number} 的信息及 {group_count} 条群成员信息")
+
+        except Exception as e:
+            logger.error(f"删除用户信息时出错: {e}")
+            yield event.plain_result(f"删除失败: {str(e)}")
+
+    # 批量修改命令允许修改的字段
+    batch_editable_fields = {
+        'address': '称呼',
+        'relationship': '关系',
+        'impression': '印象',
+        'attitude': '态度',
+        'interest': '爱好'
+    }
+
+    @azusaimp_command_group.command("batch_set")
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    async def batch_update_users(self, event: AstrMessageEvent, field: str, value: str, qq_numbers: str):
+        """批量修改多个用户的同一字段（管理员）
+        
+        Args:
+            field(string): 字段名 (address/relationship/impression/attitude/interest)
+            value(string): 新的值
+            qq_numbers(string): 目标用户QQ号，用英文逗号分隔
+        """
+        try:
+            if field not in self.batch_editable_fields:
+                yield event.plain_result(f"字段必须是: {', '.join(self.batch_editable_fields)}")
+                return
+
+            targets = list(dict.fromkeys(qq.strip() for qq in qq_numbers.split(',') if qq.strip()))
+            if not targets:
+                yield event.plain_result("请提供至少一个QQ号")
+                return
+
+            updated = self.store.update_users(targets, {field: value})
+
+            logger.info(f"管理员批量更新 {updated} 名用户的{self.batch_editable_fields[field]}: {value}")
+            yield event.plain_result(
+                f"已更新 {updated}/{len(targets)} 名用户的{self.batch_editable_fields[field]}: {value}"
+            )
+
+        except Exception as e:
+            logger.error(f"批量修改用户信息时出错: {e}")
+            yield event.plain_result(f"批量修改失败: {str(e)}")
+
+    @azusaimp_command_group.command("group_set")
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    async def batch_update_group_members(self, event: AstrMessageEvent, field: str, value: str, group_id: str = ""):
+        """批量修改某群所有已记录成员的同一字段（管理员）
+        
+        Args:
+            field(string): 字段名 (address/relationship/impression/attitude/interest)
+            value(string): 新的值
+            group_id(string): 目标群号，留空则默认为当前群
+        """
+        try:
+            if field not in self.batch_editable_fields:
+                yield event.plain_result(f"字段必须是: {', '.join(self.batch_editable_fields)}")
+                return
+
+            if not group_id:
+                group_id = event.get_group_id()
+            if not group_id:
+                yield event.plain_result("请在群聊中使用此命令或指定群号")
+                return
+
+            targets = self.store.list_group_member_ids(group_id)
+            if not targets:
+                yield event.plain_result(f"群 {group_id} 暂无成员信息记录")
+                return
+
+            updated = self.store.update_users(targets, {field: value})
+
+            logger.info(f"管理员批量更新群 {group_id} 的 {updated} 名成员的{self.batch_editable_fields[field]}: {value}")
+            yield event.plain_result(
+                f"已更新群 {group_id} 的 {updated} 名成员的{self.batch_editable_fields[field]}: {value}"
+            )
+
+        except Exception as e:
+            logger.error(f"批量修改群成员信息时出错: {e}")
+            yield event.plain_result(f"批量修改失败: {str(e)}")
+
+    @azusaimp_command_group.command("export")
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    async def export_profiles(self, event: AstrMessageEvent):
+        """导出全部用户信息和群成员信息为JSONL文件（管理员）"""
+        try:
+            export_dir = os.path.join(os.path.dirname(self.user_info_file), "exports")
+            os.makedirs(export_dir, exist_ok=True)
+            path = os.path.join(export_dir, f"azusaimp_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl")
+
+            # 导出走独立连接的读快照，在后台线程中进行，不阻塞消息处理
+            user_count, member_count = await asyncio.to_thread(self.store.export_jsonl, path)
+
+            logger.info(f"已导出 {user_count} 条用户信息和 {member_count} 条群成员信息到 {path}")
+            yield event.plain_result(f"已导出 {user_count} 条用户信息和 {member_count} 条群成员信息到 {path}")
+
+        except Exception as e:
+            logger.error(f"导出信息时出错: {e}")
+            yield event.plain_result(f"导出失败: {str(e)}")
+
+    @azusaimp_command_group.command("import")
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    async def import_profiles(self, event: AstrMessageEvent, file_name: str):
+        """从JSONL文件导入用户信息和群成员信息（管理员）
+        
+        Args:
+            file_name(string): 导入文件名，相对路径从插件数据目录下的 exports 目录查找
+        """
+        try:
+            path = file_name
+            if not os.path.isabs(path):
+                path = os.path.join(os.path.dirname(self.user_info_file), "exports", file_name)
+            if not os.path.exists(path):
+                yield event.plain_result(f"文件不存在: {path}")
+                return
+
+            # 先在后台线程中校验整个文件，格式错误时不导入任何记录
+            await asyncio.to_thread(self.store.validate_jsonl, path)
+            # 分批提交，批次之间让出事件循环，不长时间持有数据库写锁
+            user_count, member_count = 0, 0
+            for user_count, member_count in self.store.import_jsonl_batches(path):
+                await asyncio.sleep(0)
+
+            logger.info(f"已从 {path} 导入 {user_count} 条用户信息和 {member_count} 条群成员信息")
+            yield event.plain_result(f"已导入 {user_count} 条用户信息和 {member_count} 条群成员信息")
+
+        except Exception as e:
+            logger.error(f"导入信息时出错: {e}")
+            yield event.plain_result(f"导入失败: {str(e)}")
+
+    @azusaimp_command_group.command("consolidate")
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    async def consolidate_impressions(self, event: AstrMessageEvent, qq_number: str = ""):
+        """把过长或重复的印象信息加入整理队列（管理员）
+        
+        Args:
+            qq_number(str): 目标用户QQ号，留空则扫描所有用户
+        """
+        try:
+            if qq_number:
+                user_data = self.store.get_user(qq_number)
+                if user_data is None:
+                    yield event.plain_result("用户信息不存在，请先发送一条消息触发信息记录")
+                    return
+                fields = self.find_fields_to_consolidate(user_data)
+                if not fields:
+                    yield event.plain_result(f"用户 {qq_number} 的印象信息无需整理")
+                    return
+                if self.enqueue_consolidation(qq_number, fields):
+                    yield event.plain_result(f"已将用户 {qq_number} 加入印象整理队列")
+                else:
+                    yield event.plain_result(f"用户 {qq_number} 已在整理队列中或队列已满")
+                return
+
+            enqueued = await self.enqueue_consolidation_candidates()
+            yield event.plain_result(f"已将 {enqueued} 名用户加入印象整理队列")
+
+        except Exception as e:
+            logger.error(f"加入印象整理队列时出错: {e}")
+            yield event.plain_result(f"整理失败: {str(e)}")
+
+    @azusaimp_command_group.command("user_groups")
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    async def show_user_groups(self, event: AstrMessageEvent, qq_number: str = ""):
+        """查看用户所在的群（管理员）
+        
+        Args:
+            qq_number(str): 查询对象QQ号，留空则默认为自己
+        """
+        try:
+            if not qq_number:
+                qq_number = event.get_sender_id()
+
+            group_ids = sorted(self.store.get_user_groups(qq_number))
+            if not group_ids:
+                yield event.plain_result(f"暂无用户 {qq_number} 的群成员记录")
+                return
+
+            lines = [f"用户 {qq_number} 所在的群 ({len(group_ids)}):"]
+            for group_id in group_ids:
+                member_info = self.store.get_member(group_id, qq_number) or {}
+                display_name = member_info.get('display_name')
+                role = self.get_group_role_text(member_info.get('group_role', 'member'))
+                lines.append(f"{group_id} {display_name} ({role})" if display_name else f"{group_id} ({role})")
+
+            yield event.plain_result("\n".join(lines))
+
+        except Exception as e:
+            logger.error(f"查看用户所在群时出错: {e}")
+            yield event.plain_result(f"获取信息失败: {str(e)}")
+
+    @azusaimp_command_group.command("active_members")
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    async def show_active_members(self, event: AstrMessageEvent, hours: int = 24, limit: int = 10):
+        """查看本群最活跃的成员（管理员）
+        
+        Args:
+            hours(int): 统计最近多少小时，默认24
+            limit(int): 最多显示多少人，默认10
+        """
+        try:
+            group_id = event.get_group_id()
+            if not group_id:
+                yield event.plain_result("请在群聊中使用此命令")
+                return
+
+            ranked = self.store.get_most_active_members(group_id, hours=hours, limit=limit)
+            if not ranked:
+                yield event.plain_result(f"最近 {hours} 小时暂无发言记录")
+                return
+
+            lines = [f"最近 {hours} 小时最活跃的成员:"]
+            for index, (qq_number, count) in enumerate(ranked, 1):
+                member_info = self.store.get_member(group_id, qq_number) or {}
+                name = member_info.get('display_name') or qq_number
+                lines.append(f"{index}. {name} ({qq_number}): {count}条")
+
+            yield event.plain_result("\n".join(lines))
+
+        except Exception as e:
+            logger.error(f"查看活跃成员时出错: {e}")
+            yield event.plain_result(f"获取活跃成员失败: {str(e)}")
+
+    @azusaimp_command_group.command("cache_stats")
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    async def show_cache_stats(self, event: AstrMessageEvent):
+        """查看信息缓存统计（管理员）"""
+        try:
+            stats = self.store.stats()
+            info_text = (
+                f"缓存统计:\n"
+                f"命中: {stats['hits']}\n"
+                f"未命中: {stats['misses']}\n"
+                f"命中率: {stats['hit_rate']:.1%}\n"
+                f"淘汰: {stats['evictions']}\n"
+                f"缓存记录数: {stats['cached_records']}/{stats['max_records'] or '不限'}\n"
+                f"缓存字节数: {stats['cached_bytes']}/{stats['max_bytes'] or '不限'}\n"
+                f"实际写入: {stats['writes']}\n"
+                f"跳过无变化写入: {stats['skipped_writes']}"
+            )
+            yield event.plain_result(info_text)
+
+        except Exception as e:
+            logger.error(f"查看缓存统计时出错: {e}")
+            yield event.plain_result(f"获取缓存统计失败: {str(e)}")
+
+    @azusaimp_command_group.command("compact")
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    async def compact_group_info(self, event: AstrMessageEvent):
+        """立即清理过期的群成员记录（管理员）"""
+        try:
+            result = await self.run_member_retention()
+            yield event.plain_result(
+                f"清理完成: 移除失效群 {result['dropped_groups']} 个，"
+                f"退群成员 {result['left_members']} 条，过期成员 {result['expired_members']} 条"
+            )
+
+        except Exception as e:
+            logger.error(f"清理群成员记录时出错: {e}")
+            yield event.plain_result(f"清理失败: {str(e)}")
+
+    def render_member_digest(self, qq_number: str, group_member_data: Dict[str, Any], user_data: Dict[str, Any],
+                             messages_24h: int, messages_7d: int) -> str:
+        """渲染单个群成员的摘要文本"""
+        username = user_data.get("nickname") or f"用户{qq_number}"
+        display_name = group_member_data.get("display_name") or username
+        address = user_data.get("address") or username
+        birthday = user_data.get("birthday", "未知")
+        interest = user_data.get("interest", "")
+
+        member_prompt = f"用户QQ号: {qq_number}，"
+        member_prompt += f"昵称: {username}，"
+        member_prompt += f"群昵称: {display_name}，" if display_name != username else ""
+        member_prompt += f"你对ta的称呼是: {address}，"
+        member_prompt += f"性别: {user_data.get('gender', '未知')}，"
+        member_prompt += f"生日: {birthday}，"
+        if birthday != "未知":
+            age = self.calculate_age(birthday)
+            member_prompt += f"年龄: {age}岁，" if age > 0 else ""
+        member_prompt += f"群身份: {self.get_group_role_text(group_member_data.get('group_role', 'member'))}，"
+        member_prompt += f"群头衔: {group_member_data.get('group_title', '无') or '无'}，"
+        member_prompt += f"近24小时发言: {messages_24h}条，近7天发言: {messages_7d}条，"
+        member_prompt += f"关系: {user_data.get('relationship', '网友')}，"
+        member_prompt += f"印象: {user_data.get('impression', '无印象')}，"
+        member_prompt += f"态度: {user_data.get('attitude', '不冷不热')}，"
+        member_prompt += f"爱好: {interest}" if interest else ""
+        return member_prompt
+
+    def get_roster_digest(self, group_id: str) -> Dict[str, Any]:
+        """获取群成员摘要缓存
+
+        首次访问或超过有效期时整群重建，之后只重新渲染并序列化变更过的成员；
+        成员列表的 JSON 由各成员序列化好的片段拼接而成，没有变更时直接复用。
+        发言统计每条消息都会变化，不单独触发重新渲染，随有效期整群重建时刷新。
+        """
+        ttl = self.config.get("roster_digest_ttl_minutes", 10) * 60
+        digest = self._roster_digests.get(group_id)
+
+        if digest is None or time.time() - digest["built_at"] >= ttl:
+            group_members = self.store.get_group_members(group_id)
+            users = self.store.get_users(list(group_members), populate_cache=False)
+            activity_24h = self.store.get_group_activity(group_id, 24)
+            activity_7d = self.store.get_group_activity(group_id, 24 * 7)
+            digest = {
+                "members": {
+                    qq_number: json.dumps(self.render_member_digest(
+                        qq_number, group_member_data, users.get(qq_number, {}),
+                        activity_24h.get(qq_number, 0), activity_7d.get(qq_number, 0)
+                    ), ensure_ascii=False)
+                    for qq_number, group_member_data in group_members.items()
+                },
+                "dirty": set(),
+                "members_json": None,
+                "built_at": time.time()
+            }
+            self._roster_digests[group_id] = digest
+
+        elif digest["dirty"]:
+            dirty = list(digest["dirty"])
+            digest["dirty"].clear()
+            group_members = self.store.get_members(group_id, dirty)
+            users = self.store.get_users(dirty)
+            for qq_number in dirty:
+                group_member_data = group_members.get(qq_number)
+                if group_member_data is None:
+                    # 成员记录已被删除
+                    digest["members"].pop(qq_number, None)
+                    continue
+                digest["members"][qq_number] = json.dumps(self.render_member_digest(
+                    qq_number, group_member_data, users.get(qq_number, {}),
+                    self.store.get_activity(group_id, qq_number, 24),
+                    self.store.get_activity(group_id, qq_number, 24 * 7)
+                ), ensure_ascii=False)
+
+        if digest["members_json"] is None:
+            digest["members_json"] = f"[{', '.join(digest['members'].values())}]"
+        return digest
+
+    def on_store_change(self, kind: str, group_id: str, qq_number: str):
+        """信息存储变更回调，把受影响的群成员摘要标记为待重新渲染"""
+        if kind == "user":
+            group_ids = self.store.get_user_groups(qq_number)
+        elif kind == "member":
+            group_ids = [group_id]
+        elif kind == "activity":
+            # 发言计数每条消息都会变化，随有效期整群重建时刷新，避免每次调用工具都重新拼接整群
+            return
+        elif kind == "group":
+            self._roster_digests.pop(group_id, None)
+            return
+        else:
+            self._roster_digests.clear()
+            return
+
+        for changed_group_id in group_ids:
+            digest = self._roster_digests.get(changed_group_id)
+            if digest is not None:
+                digest["dirty"].add(qq_number)
+                digest["members_json"] = None
+
     @filter.llm_tool(name="get_group_member_info")
     async def get_group_member_info_tool(self, event: AstrMessageEvent) -> MessageEventResult:
         '''获取群成员信息。
@@ -826,80 +1246,21 @@ class AzusaImp(Star):
             if event.get_platform_name() != "aiocqhttp":
                 return
             
-            # 加载用户信息和群信息
-            all_user_info = self.load_user_info()
-            all_group_info = self.load_group_info()
-            
-            # 获取当前群的所有成员信息
-            current_group_info = all_group_info.get(group_id, {})
-            if not current_group_info:
+            # 获取当前群预渲染好的成员摘要
+            digest = self.get_roster_digest(group_id)
+            if not digest["members"]:
                 return json.dumps({"error": "该群暂无成员信息记录"})
-            
-
-            # 处理每个成员的信息
-            processed_members = []
-            for qq_number, group_member_data in current_group_info.items():
-                user_data = all_user_info.get(qq_number, {})
-
-                # 构建成员信息
-                member_info = {
-                    "user_id": str(qq_number),
-                    "display_name": group_member_data.get("display_name") or user_data.get("nickname") or f"用户{qq_number}",
-                    "username": user_data.get("nickname") or f"用户{qq_number}",
-                    "username": user_data.get("address"),
-                    "gender": user_data.get("gender", "未知"),
-                    "birthday": user_data.get("birthday", "未知"),
-                    "group_role": self.get_group_role_text(group_member_data.get("group_role", "member")),
-                    "group_title": group_member_data.get("group_title", "无") or "无",
-                    "relationship": user_data.get("relationship", "网友"),
-                    "impression": user_data.get("impression", "无印象"),
-                    "attitude": user_data.get("attitude", "不冷不热"),
-                    "interest": user_data.get("interest", "")
-                }
-
-
-                # 计算年龄
-                birthday = user_data.get("birthday", "未知")
-                if birthday != "未知":
-                    age = self.calculate_age(birthday)
-                    if age > 0:
-                        member_info["age"] = age
-
-
-                member_prompt = ""
-                member_prompt += f"用户QQ号: {qq_number}，"
-                member_prompt += f"昵称: {member_info['username']}，"
-                member_prompt += f"群昵称: {member_info['display_name']}，" if member_info['display_name'] != member_info['username'] else ""
-                member_prompt += f"你对ta的称呼是: {member_info['address']}，"
-                member_prompt += f"性别: {member_info['gender']}，"
-                member_prompt += f"生日: {member_info['birthday']}，"
-                member_prompt += f"年龄: {member_info['age']}岁，" if 'age' in member_info['age'] else ""
-                member_prompt += f"群身份: {member_info['group_role']}，"
-                member_prompt += f"群头衔: {member_info['group_title']}，"
-                member_prompt += f"关系: {member_info['relationship']}，"
-                member_prompt += f"印象: {member_info['impression']}，"
-                member_prompt += f"态度: {member_info['attitude']}，"
-                member_prompt += f"爱好: {member_info['interest']}" if member_info['interest'] else ""
-
-
-                processed_members.append(member_prompt)
-
-
-                # 构建群信息
-            group_complete_info = {
-                "group_id": group_id,
-                "member_count": len(processed_members),
-                "timestamp": datetime.now().isoformat(),
-                "members": processed_members
-            }
-            
 
+            member_count = len(digest["members"])
             elapsed_time = time.time() - start_time
-            logger.debug(f"成功将以下内容加入提示词:\n{processed_members}")
-            logger.info(f"成功获取群 {group_id} 的 {len(processed_members)} 名成员完整信息，耗时 {elapsed_time:.2f}s")
+            logger.debug(f"成功将以下内容加入提示词:\n{digest['members_json']}")
+            logger.info(f"成功获取群 {group_id} 的 {member_count} 名成员完整信息，耗时 {elapsed_time:.2f}s")
             
-            # 出错时不返回任何信息
-            return json.dumps(group_complete_info, ensure_ascii=False, indent=2)
+            # 成员列表已预先序列化，这里只拼接外层字段
+            return (
+                f'{{"group_id":{json.dumps(group_id)},"member_count":{member_count},'
+                f'"timestamp":"{datetime.now().isoformat()}","members":{digest["members_json"]}}}'
+            )
 
 
         except Exception as e:
@@ -910,6 +1271,343 @@ class AzusaImp(Star):
 
 
 
+    async def _maintenance_loop(self):
+        """后台维护任务，定期清理过期的群成员记录和变更日志"""
+        while True:
+            interval = self.config.get("maintenance_interval_minutes", 60)
+            await asyncio.sleep(max(interval, 1) * 60)
+            try:
+                await self.run_member_retention()
+                self.store.prune_changes()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"后台维护任务出错: {e}")
+
+    async def _activity_flush_loop(self):
+        """定期把内存中累积的发言计数批量写入数据库"""
+        while True:
+            await asyncio.sleep(max(self.config.get("activity_flush_interval_seconds", 30), 1))
+            try:
+                self.store.flush_activity()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"保存发言计数时出错: {e}")
+
+    def is_member_expired(self, timestamp: str, cutoff: datetime) -> bool:
+        """判断群成员记录的最后活跃时间是否早于截止时间"""
+        if not timestamp:
+            return False
+        try:
+            return datetime.fromisoformat(timestamp) < cutoff
+        except (TypeError, ValueError):
+            return False
+
+    async def run_member_retention(self) -> Dict[str, int]:
+        """清理退群成员、失效群和长期未发言的群成员记录
+
+        按批次增量扫描，每批之间让出事件循环，避免阻塞消息处理。
+
+        Returns:
+            dict: 本次清理的统计
+        """
+        result = {"dropped_groups": 0, "left_members": 0, "expired_members": 0}
+        retention_days = self.config.get("member_retention_days", 90)
+        batch_size = max(self.config.get("maintenance_batch_size", 200), 1)
+
+        # 1. 根据协议端的群列表和成员列表做差集
+        if self.config.get("retention_use_roster", False):
+            await self.prune_by_roster(result, batch_size)
+
+        # 2. 根据最后活跃时间清理过期成员
+        if retention_days > 0:
+            cutoff = datetime.now() - timedelta(days=retention_days)
+            after = None
+            while True:
+                batch = self.store.scan_member_timestamps(after, batch_size)
+                if not batch:
+                    break
+                after = (batch[-1][0], batch[-1][1])
+                expired = [
+                    (group_id, qq_number)
+                    for group_id, qq_number, timestamp in batch
+                    if self.is_member_expired(timestamp, cutoff)
+                ]
+                self.store.delete_members(expired)
+                result["expired_members"] += len(expired)
+                await asyncio.sleep(0)
+
+        if any(result.values()):
+            logger.info(
+                f"群成员记录清理完成: 移除失效群 {result['dropped_groups']} 个，"
+                f"退群成员 {result['left_members']} 条，过期成员 {result['expired_members']} 条"
+            )
+        return result
+
+    def load_client_groups(self) -> Dict[str, Set[str]]:
+        """读取各机器人账号见到过的群"""
+        try:
+            data = json.loads(self.store.get_meta("client_groups") or "{}")
+        except ValueError:
+            data = {}
+        return {self_id: set(groups) for self_id, groups in data.items()}
+
+    def save_client_groups(self, client_groups: Dict[str, Set[str]]):
+        """保存各机器人账号见到过的群，需在事务中调用"""
+        self.store.set_meta("client_groups", json.dumps(
+            {self_id: sorted(groups) for self_id, groups in client_groups.items()}
+        ))
+
+    def remember_client_group(self, self_id: str, group_id: str):
+        """记录经由某个机器人账号见到了某个群，只在首次见到时写入数据库"""
+        if group_id in self._client_groups.get(self_id, ()):
+            return
+        with self.store.transaction():
+            # 共享模式下其他进程可能记录了别的账号，重新读取后合并
+            client_groups = self.load_client_groups()
+            client_groups.setdefault(self_id, set()).add(group_id)
+            self.save_client_groups(client_groups)
+        self._client_groups = client_groups
+
+    def forget_client_group(self, group_id: str):
+        """群记录被删除后，从所有账号见到过的群中移除"""
+        with self.store.transaction():
+            client_groups = self.load_client_groups()
+            for groups in client_groups.values():
+                groups.discard(group_id)
+            self.save_client_groups({self_id: groups for self_id, groups in client_groups.items() if groups})
+        self._client_groups = client_groups
+
+    async def prune_by_roster(self, result: Dict[str, int], batch_size: int):
+        """根据各机器人账号的群列表和成员列表清理退群成员和失效群
+
+        每个账号只对经由它收到过消息的群做差集，只有一个账号时对所有群做差集，群被任一账号的群列表包含时都不删除。
+        协议端在登录或重连期间可能返回空列表，此时跳过该账号或该群。
+        """
+        self._client_groups = self.load_client_groups()
+        single_account = len(set(self._client_groups) | set(self._qq_clients)) == 1
+        joined: Dict[str, Set[str]] = {}
+        for self_id, client in list(self._qq_clients.items()):
+            try:
+                group_list = await client.api.call_action('get_group_list')
+            except Exception as e:
+                logger.error(f"获取账号 {self_id} 的群列表失败: {e}")
+                continue
+            groups = {str(group['group_id']) for group in group_list or []}
+            if not groups:
+                logger.warning(f"账号 {self_id} 的群列表为空，跳过本轮按群列表清理")
+                continue
+            joined[self_id] = groups
+
+        all_joined = set().union(*joined.values())
+        stored_groups = set(self.store.list_groups())
+        checked = set()
+        for self_id, groups in joined.items():
+            seen_groups = set(stored_groups) if single_account else self._client_groups.get(self_id, set())
+            for group_id in sorted(seen_groups & stored_groups):
+                if group_id not in all_joined:
+                    self.store.delete_group(group_id)
+                    stored_groups.discard(group_id)
+                    self.forget_client_group(group_id)
+                    result["dropped_groups"] += 1
+                    continue
+                if group_id not in groups or group_id in checked:
+                    continue
+                checked.add(group_id)
+
+                try:
+                    member_list = await self._qq_clients[self_id].api.call_action(
+                        'get_group_member_list', group_id=int(group_id)
+                    )
+                except Exception as e:
+                    logger.error(f"获取群 {group_id} 的成员列表失败: {e}")
+                    continue
+                roster = {str(member['user_id']) for member in member_list or []}
+                if not roster:
+                    continue
+                left_members = [
+                    (group_id, qq_number)
+                    for qq_number in self.store.list_group_member_ids(group_id)
+                    if qq_number not in roster
+                ]
+                for i in range(0, len(left_members), batch_size):
+                    self.store.delete_members(left_members[i:i + batch_size])
+                    await asyncio.sleep(0)
+                result["left_members"] += len(left_members)
+
+    # 印象整理任务处理的字段
+    consolidation_fields = {
+        'relationship': '关系',
+        'impression': '印象',
+        'attitude': '态度'
+    }
+
+    def has_redundant_segments(self, value: str) -> bool:
+        """描述中是否有重复的短句"""
+        segments = [segment.strip() for segment in re.split(r'[，,；;、。]', value) if segment.strip()]
+        return len(segments) != len(set(segments))
+
+    def find_fields_to_consolidate(self, user_data: Dict[str, Any]) -> List[str]:
+        """找出过长或有重复内容、需要整理的字段"""
+        max_chars = self.config.get("consolidation_max_chars", 60)
+        fields = []
+        for field in self.consolidation_fields:
+            value = user_data.get(field)
+            if not isinstance(value, str) or not value:
+                continue
+            if len(value) > max_chars or self.has_redundant_segments(value):
+                fields.append(field)
+        return fields
+
+    def enqueue_consolidation(self, qq_number: str, fields: List[str]) -> bool:
+        """把用户加入印象整理队列，已在队列中或队列已满时返回 False"""
+        if not fields or qq_number in self._consolidation_pending:
+            return False
+        try:
+            self._consolidation_queue.put_nowait((qq_number, fields))
+        except asyncio.QueueFull:
+            return False
+        self._consolidation_pending.add(qq_number)
+        return True
+
+    async def enqueue_consolidation_candidates(self) -> int:
+        """分批扫描所有用户，把需要整理的加入队列
+
+        Returns:
+            int: 新加入队列的用户数
+        """
+        batch_size = max(self.config.get("maintenance_batch_size", 200), 1)
+        enqueued = 0
+        after = None
+        while not self._consolidation_queue.full():
+            batch = self.store.scan_users(after, batch_size)
+            if not batch:
+                break
+            after = batch[-1][0]
+            for qq_number, user_data in batch:
+                if self.enqueue_consolidation(qq_number, self.find_fields_to_consolidate(user_data)):
+                    enqueued += 1
+            await asyncio.sleep(0)
+        return enqueued
+
+    def get_consolidation_provider(self):
+        """获取印象整理使用的LLM提供商，未单独配置时使用当前提供商"""
+        provider_id = self.config.get("consolidation_provider_id", "")
+        if provider_id:
+            return self.context.get_provider_by_id(provider_id)
+        return self.context.get_using_provider()
+
+    async def consolidate_user_fields(self, qq_number: str, fields: List[str]) -> Dict[str, str]:
+        """调用LLM把用户的若干字段改写为简短概括
+
+        LLM调用期间字段被其他途径修改过的，放弃本次改写。
+
+        Returns:
+            dict: 实际写回的字段
+        """
+        provider = self.get_consolidation_provider()
+        if provider is None:
+            logger.warning("印象整理任务未找到可用的LLM提供商")
+            return {}
+
+        user_data = self.store.get_user(qq_number)
+        if user_data is None:
+            return {}
+
+        max_chars = self.config.get("consolidation_max_chars", 60)
+        updated = {}
+        for field in fields:
+            old_value = user_data.get(field)
+            if not old_value:
+                continue
+
+            prompt = (
+                f"以下是你对一位用户的{self.consolidation_fields[field]}描述:\n{old_value}\n\n"
+                f"请将其整理为不超过{max_chars}字的简洁概括，保留关键信息，去除重复内容。只输出整理后的描述本身。"
+            )
+            llm_resp = await provider.text_chat(
+                prompt=prompt,
+                contexts=[],
+                system_prompt="你是一个负责整理和压缩文本描述的助手。"
+            )
+            new_value = (llm_resp.completion_text or "").strip()
+            if not new_value or new_value == old_value:
+                continue
+            if len(new_value) > max_chars:
+                # 截断会留下半句话，视为本次整理失败，等下一轮扫描重试
+                logger.debug(f"用户 {qq_number} 的{self.consolidation_fields[field]}整理结果超过 {max_chars} 字，跳过")
+                continue
+
+            with self.store.transaction():
+                current = self.store.get_user(qq_number)
+                if current is None or current.get(field) != old_value:
+                    logger.debug(f"用户 {qq_number} 的{self.consolidation_fields[field]}在整理期间已变更，跳过")
+                    continue
+                self.store.update_user(qq_number, {field: new_value})
+            updated[field] = new_value
+
+        if updated:
+            logger.info(f"已整理用户 {qq_number} 的印象信息: {updated}")
+        return updated
+
+    async def _consolidation_loop(self):
+        """定期扫描需要整理的用户并加入队列"""
+        while True:
+            interval = self.config.get("consolidation_interval_minutes", 360)
+            await asyncio.sleep(max(interval, 1) * 60)
+            if not self.config.get("enable_consolidation", False):
+                continue
+            try:
+                enqueued = await self.enqueue_consolidation_candidates()
+                if enqueued:
+                    logger.info(f"已将 {enqueued} 名用户加入印象整理队列")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"扫描待整理用户时出错: {e}")
+
+    async def _consolidation_worker(self):
+        """印象整理工作协程，每处理完一个用户后等待一段时间，避免与正常对话争用LLM"""
+        while True:
+            qq_number, fields = await self._consolidation_queue.get()
+            try:
+                await self.consolidate_user_fields(qq_number, fields)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"整理用户 {qq_number} 的印象信息时出错: {e}")
+            finally:
+                self._consolidation_pending.discard(qq_number)
+                self._consolidation_queue.task_done()
+            await asyncio.sleep(self.config.get("consolidation_delay_seconds", 10))
+
+    async def _hot_reload_loop(self):
+        """轮询信息文件的外部修改，并按间隔把变更写出到镜像文件"""
+        while True:
+            try:
+                await self.json_mirror.check()
+                mirror_interval = self.config.get("json_mirror_interval_seconds", 300)
+                if self.json_mirror.dirty and time.time() - self.json_mirror.last_flush >= mirror_interval:
+                    await self.json_mirror.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"检查信息文件修改时出错: {e}")
+            await asyncio.sleep(max(self.config.get("hot_reload_interval_seconds", 5), 1))
+
     async def terminate(self):
         """插件卸载时的清理工作"""
+        self._maintenance_task.cancel()
+        self._activity_flush_task.cancel()
+        if self._hot_reload_task is not None:
+            self._hot_reload_task.cancel()
+            # 只合并尚未处理的手动修改，镜像文件在下次启动时重新写出
+            try:
+                await self.json_mirror.check()
+            except Exception as e:
+                logger.error(f"合并信息文件修改失败: {e}")
+        for task in self._consolidation_tasks:
+            task.cancel()
+        self.store.close()
         logger.info("QQ用户信息记录器插件已卸载")
\ No newline at end of file
@@ -0,0 +1,987 @@
+from astrbot.api import logger
+import json
+import os
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Any, Iterator, List, Optional, Set, Tuple
+from .activity import ActivityCounter
+
+# 变更日志最多保留的条数，落后更多的实例会整体失效重建工作集
+CHANGE_LOG_KEEP = 10000
+
+
+class ProfileStore:
+    """用户/群成员信息存储
+
+    热数据保存在内存中的 LRU 工作集里，冷数据落在 SQLite 磁盘层，
+    被淘汰的记录在用户再次发言时按需从磁盘读回。
+
+    所有写入都在 SQLite 的 IMMEDIATE 事务中完成。共享模式下每次写入还会追加一条
+    变更日志，多个进程共用同一个数据目录时，各自只根据变更序号失效发生变化的记录。
+    """
+
+    def __init__(self, data_dir: str, max_records: int = 2000, max_bytes: int = 0, shared: bool = False,
+                 member_touch_interval: int = 3600):
+        """
+        Args:
+            data_dir: 数据目录
+            max_records: 内存工作集最多缓存的记录数，0 表示不限制
+            max_bytes: 内存工作集最多占用的字节数（按序列化长度估算），0 表示不限制
+            shared: 是否有多个进程共用该数据目录
+            member_touch_interval: 群成员信息除最后活跃时间外没有变化时，最后活跃时间的最短写入间隔（秒）
+        """
+        self.data_dir = data_dir
+        self.db_file = os.path.join(data_dir, "profiles.db")
+        self.legacy_user_file = os.path.join(data_dir, "user_info.json")
+        self.legacy_group_file = os.path.join(data_dir, "group_info.json")
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.member_touch_interval = member_touch_interval
+
+        # 工作集: key -> (记录, 估算字节数)
+        # 用户记录的 key 为 ("user", qq_number)，群成员记录的 key 为 ("member", group_id, qq_number)，
+        # 发言计数器的 key 为 ("activity", group_id, qq_number)
+        self._cache: "OrderedDict[Tuple[str, ...], Tuple[Any, int]]" = OrderedDict()
+        self._cached_bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "writes": 0, "skipped_writes": 0}
+        # 反向索引: qq_number -> 所在群号集合，只存键不存记录
+        self._user_groups: Dict[str, Set[str]] = {}
+        # 尚未写入磁盘层的发言计数: (group_id, qq_number) -> {小时序号: 发言数}，由 flush_activity 批量写入
+        self._pending_activity: Dict[Tuple[str, str], Dict[int, int]] = {}
+
+        # 多进程共享
+        self.shared = shared
+        self._instance_id = uuid.uuid4().hex
+        self._last_seq = 0
+        self._txn_depth = 0
+        self._refreshing = False
+        self._pending_changes: List[Tuple[str, str, str]] = []
+        # 变更回调 callback(kind, group_id, qq_number)
+        self._listeners: List[Callable[[str, str, str], None]] = []
+
+        # 事务由 transaction() 显式管理
+        self._conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._init_schema()
+        row = self._conn.execute("SELECT MAX(seq) FROM changes").fetchone()
+        self._last_seq = row[0] or 0
+        self._import_legacy_json()
+        self._build_user_groups_index()
+
+    def _init_schema(self):
+        """建表"""
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS user_info (
+                qq_number TEXT PRIMARY KEY,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS group_info (
+                group_id TEXT NOT NULL,
+                qq_number TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (group_id, qq_number)
+            );
+            CREATE TABLE IF NOT EXISTS activity (
+                group_id TEXT NOT NULL,
+                qq_number TEXT NOT NULL,
+                last_hour INTEGER NOT NULL,
+                last_day INTEGER NOT NULL,
+                hourly BLOB NOT NULL,
+                daily BLOB NOT NULL,
+                PRIMARY KEY (group_id, qq_number)
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                instance_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                group_id TEXT NOT NULL,
+                qq_number TEXT NOT NULL
+            );
+            """
+        )
+
+    def _import_legacy_json(self):
+        """首次启动时把旧版 user_info.json / group_info.json 导入数据库"""
+        user_count = 0
+        group_count = 0
+        try:
+            with self.transaction():
+                # 其他进程可能已经导入过
+                row = self._conn.execute("SELECT value FROM meta WHERE key = 'legacy_imported'").fetchone()
+                if row:
+                    return
+                user_count, group_count = self._load_legacy_json()
+                self._log_change("reset")
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_imported', '1')")
+        except Exception as e:
+            logger.error(f"导入旧版信息文件失败: {e}")
+            return
+
+        if user_count or group_count:
+            logger.info(f"已从旧版文件导入 {user_count} 条用户信息和 {group_count} 条群成员信息")
+
+    def _load_legacy_json(self) -> Tuple[int, int]:
+        """把旧版 JSON 文件写入数据库，需在事务中调用"""
+        user_count = 0
+        group_count = 0
+        if os.path.exists(self.legacy_user_file):
+            with open(self.legacy_user_file, 'r', encoding='utf-8') as f:
+                legacy_users = json.load(f)
+            for qq_number, record in legacy_users.items():
+                if not isinstance(record, dict):
+                    continue
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO user_info (qq_number, data) VALUES (?, ?)",
+                    (str(qq_number), json.dumps(record, ensure_ascii=False))
+                )
+                user_count += 1
+
+        if os.path.exists(self.legacy_group_file):
+            with open(self.legacy_group_file, 'r', encoding='utf-8') as f:
+                legacy_groups = json.load(f)
+            for group_id, members in legacy_groups.items():
+                if not isinstance(members, dict):
+                    continue
+                for qq_number, record in members.items():
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO group_info (group_id, qq_number, data) VALUES (?, ?, ?)",
+                        (str(group_id), str(qq_number), json.dumps(record, ensure_ascii=False))
+                    )
+                    group_count += 1
+        return user_count, group_count
+
+    def _build_user_groups_index(self):
+        """从磁盘层重建 qq_number -> 群号 的反向索引"""
+        self._user_groups = {}
+        for group_id, qq_number in self._conn.execute("SELECT group_id, qq_number FROM group_info"):
+            self._user_groups.setdefault(qq_number, set()).add(group_id)
+
+    def _index_add(self, group_id: str, qq_number: str):
+        self._user_groups.setdefault(qq_number, set()).add(group_id)
+
+    def _index_remove(self, group_id: str, qq_number: str):
+        groups = self._user_groups.get(qq_number)
+        if groups is None:
+            return
+        groups.discard(group_id)
+        if not groups:
+            del self._user_groups[qq_number]
+
+    # ---------- 事务与多进程同步 ----------
+
+    @contextmanager
+    def transaction(self):
+        """写事务，可嵌套，只有最外层提交
+
+        最外层事务以 BEGIN IMMEDIATE 开始，先拿到数据库写锁再同步其他进程的变更，
+        因此事务内的读-改-写不会覆盖其他进程的更新。
+        """
+        if self._txn_depth:
+            self._txn_depth += 1
+            try:
+                yield
+            finally:
+                self._txn_depth -= 1
+            return
+
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._txn_depth = 1
+        try:
+            self.refresh()
+            yield
+            if self._pending_changes:
+                self._conn.executemany(
+                    "INSERT INTO changes (instance_id, kind, group_id, qq_number) VALUES (?, ?, ?, ?)",
+                    [(self._instance_id, *change) for change in self._pending_changes]
+                )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            # 工作集里可能有未提交的修改，整体失效
+            self._reset_working_set()
+            raise
+        finally:
+            self._txn_depth = 0
+            self._pending_changes = []
+
+    def add_listener(self, callback: Callable[[str, str, str], None]):
+        """注册变更回调
+
+        本进程的写入和同步到的其他进程变更都会以 callback(kind, group_id, qq_number) 通知，
+        kind 为 user / member / activity / group / reset。回调里可以读取，但不应写入。
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, kind: str, group_id: str = "", qq_number: str = ""):
+        for callback in self._listeners:
+            try:
+                callback(kind, group_id, qq_number)
+            except Exception as e:
+                logger.error(f"信息变更回调出错: {e}")
+
+    def _log_change(self, kind: str, group_id: str = "", qq_number: str = ""):
+        """记录一条变更并通知回调，变更日志随事务一起提交，仅共享模式下记录"""
+        if self.shared:
+            self._pending_changes.append((kind, group_id, qq_number))
+        self._notify(kind, group_id, qq_number)
+
+    def _reset_working_set(self):
+        """清空工作集并重建反向索引"""
+        self._cache.clear()
+        self._cached_bytes = 0
+        self._build_user_groups_index()
+        self._notify("reset")
+
+    def _maybe_refresh(self):
+        if self.shared and not self._txn_depth and not self._refreshing:
+            self.refresh()
+
+    def refresh(self):
+        """同步其他进程的变更，只失效发生变化的记录"""
+        if not self.shared or self._refreshing:
+            return
+        self._refreshing = True
+        try:
+            self._apply_remote_changes()
+        finally:
+            self._refreshing = False
+
+    def _apply_remote_changes(self):
+        row = self._conn.execute("SELECT MIN(seq), MAX(seq) FROM changes").fetchone()
+        first_seq, last_seq = row
+        if last_seq is None or last_seq <= self._last_seq:
+            return
+        if first_seq > self._last_seq + 1:
+            # 落后太多，需要的变更日志已被清理
+            self._reset_working_set()
+            self._last_seq = last_seq
+            return
+
+        rows = self._conn.execute(
+            "SELECT seq, instance_id, kind, group_id, qq_number FROM changes WHERE seq > ? ORDER BY seq",
+            (self._last_seq,)
+        ).fetchall()
+        for seq, instance_id, kind, group_id, qq_number in rows:
+            self._last_seq = seq
+            if instance_id == self._instance_id:
+                continue
+            if kind == "user":
+                self._cache_drop(("user", qq_number))
+            elif kind == "member":
+                self._cache_drop(("member", group_id, qq_number))
+                exists = self._conn.execute(
+                    "SELECT 1 FROM group_info WHERE group_id = ? AND qq_number = ?",
+                    (group_id, qq_number)
+                ).fetchone()
+                if exists:
+                    self._index_add(group_id, qq_number)
+                else:
+                    self._index_remove(group_id, qq_number)
+            elif kind == "activity":
+                self._cache_drop(("activity", group_id, qq_number))
+            elif kind == "group":
+                for key in [key for key in self._cache if key[0] != "user" and key[1] == group_id]:
+                    self._cache_drop(key)
+                for member_qq in [qq for qq, groups in self._user_groups.items() if group_id in groups]:
+                    self._index_remove(group_id, member_qq)
+            else:
+                self._reset_working_set()
+                continue
+            self._notify(kind, group_id, qq_number)
+
+    def prune_changes(self, keep: int = CHANGE_LOG_KEEP):
+        """清理过旧的变更日志"""
+        if not self.shared:
+            return
+        with self.transaction():
+            self._conn.execute(
+                "DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?", (keep,)
+            )
+
+    def get_meta(self, key: str) -> Optional[str]:
+        """读取元数据"""
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        """写入元数据"""
+        with self.transaction():
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    # ---------- 工作集 ----------
+
+    def _cache_get(self, key: Tuple[str, ...]) -> Any:
+        entry = self._cache.get(key)
+        if entry is None:
+            self._stats["misses"] += 1
+            return None
+        self._stats["hits"] += 1
+        self._cache.move_to_end(key)
+        return entry[0]
+
+    def _cache_put(self, key: Tuple[str, ...], record: Any, size: int):
+        old = self._cache.pop(key, None)
+        if old is not None:
+            self._cached_bytes -= old[1]
+        self._cache[key] = (record, size)
+        self._cached_bytes += size
+        self._evict()
+
+    def _cache_drop(self, key: Tuple[str, ...]):
+        old = self._cache.pop(key, None)
+        if old is not None:
+            self._cached_bytes -= old[1]
+
+    def _evict(self):
+        """淘汰最久未使用的记录，磁盘层始终是最新的，所以淘汰时直接丢弃即可"""
+        while self._cache and (
+            (self.max_records and len(self._cache) > self.max_records)
+            or (self.max_bytes and self._cached_bytes > self.max_bytes)
+        ):
+            _, (_, size) = self._cache.popitem(last=False)
+            self._cached_bytes -= size
+            self._stats["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存命中/未命中/淘汰计数，以及实际写入/跳过的无变化写入计数"""
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            "cached_records": len(self._cache),
+            "cached_bytes": self._cached_bytes,
+            "max_records": self.max_records,
+            "max_bytes": self.max_bytes,
+        }
+
+    # ---------- 用户信息 ----------
+
+    def get_user(self, qq_number: str) -> Optional[Dict[str, Any]]:
+        """获取用户信息，返回副本，修改后需调用 put_user 写回"""
+        self._maybe_refresh()
+        key = ("user", qq_number)
+        record = self._cache_get(key)
+        if record is None:
+            row = self._conn.execute(
+                "SELECT data FROM user_info WHERE qq_number = ?", (qq_number,)
+            ).fetchone()
+            if row is None:
+                return None
+            record = json.loads(row[0])
+            self._cache_put(key, record, len(row[0]))
+        return dict(record)
+
+    def get_users(self, qq_numbers: List[str], populate_cache: bool = True) -> Dict[str, Dict[str, Any]]:
+        """批量获取用户信息，工作集未命中的记录用一次查询从磁盘层读回
+
+        Args:
+            qq_numbers: QQ号列表
+            populate_cache: 是否把从磁盘层读回的记录放入工作集，批量操作时应关闭
+
+        Returns:
+            dict: qq_number -> 用户信息副本，不存在的用户不包含在内
+        """
+        self._maybe_refresh()
+        result = {}
+        missing = []
+        for qq_number in qq_numbers:
+            record = self._cache_get(("user", qq_number))
+            if record is None:
+                missing.append(qq_number)
+            else:
+                result[qq_number] = dict(record)
+
+        if missing:
+            placeholders = ",".join("?" * len(missing))
+            rows = self._conn.execute(
+                f"SELECT qq_number, data FROM user_info WHERE qq_number IN ({placeholders})", missing
+            ).fetchall()
+            for qq_number, data in rows:
+                record = json.loads(data)
+                if populate_cache:
+                    self._cache_put(("user", qq_number), record, len(data))
+                result[qq_number] = dict(record)
+        return result
+
+    def _peek_users(self, qq_numbers: List[str]) -> Dict[str, Dict[str, Any]]:
+        """写入前比较用的读取，不计入命中统计、不调整淘汰顺序，也不放入工作集"""
+        result = {}
+        missing = []
+        for qq_number in qq_numbers:
+            entry = self._cache.get(("user", qq_number))
+            if entry is None:
+                missing.append(qq_number)
+            else:
+                result[qq_number] = dict(entry[0])
+        if missing:
+            placeholders = ",".join("?" * len(missing))
+            rows = self._conn.execute(
+                f"SELECT qq_number, data FROM user_info WHERE qq_number IN ({placeholders})", missing
+            ).fetchall()
+            for qq_number, data in rows:
+                result[qq_number] = json.loads(data)
+        return result
+
+    def put_user(self, qq_number: str, record: Dict[str, Any]):
+        """写入用户信息，内容与已存记录相同时跳过"""
+        with self.transaction():
+            if self._peek_users([qq_number]).get(qq_number) == record:
+                self._stats["skipped_writes"] += 1
+                return
+            data = json.dumps(record, ensure_ascii=False)
+            self._stats["writes"] += 1
+            self._conn.execute(
+                "INSERT OR REPLACE INTO user_info (qq_number, data) VALUES (?, ?)",
+                (qq_number, data)
+            )
+            self._log_change("user", "", qq_number)
+            self._cache_put(("user", qq_number), dict(record), len(data))
+
+    def update_user(self, qq_number: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """在同一事务内读取并合并更新用户信息的部分字段
+
+        Returns:
+            dict: 更新后的用户信息，用户不存在时返回 None
+        """
+        with self.transaction():
+            record = self._peek_users([qq_number]).get(qq_number)
+            if record is None:
+                return None
+            record.update(fields)
+            self.put_user(qq_number, record)
+        return record
+
+    def scan_users(self, after: Optional[str], limit: int) -> List[Tuple[str, Dict[str, Any]]]:
+        """按QQ号顺序分批扫描用户信息，直接读磁盘层，不放入工作集
+
+        Args:
+            after: 上一批最后一个QQ号，为 None 时从头开始
+            limit: 本批最多返回的条数
+        """
+        if after is None:
+            rows = self._conn.execute(
+                "SELECT qq_number, data FROM user_info ORDER BY qq_number LIMIT ?", (limit,)
+            ).fetchall()
+        else:
+            rows = self._conn.execute(
+                "SELECT qq_number, data FROM user_info WHERE qq_number > ? ORDER BY qq_number LIMIT ?",
+                (after, limit)
+            ).fetchall()
+        return [(qq_number, json.loads(data)) for qq_number, data in rows]
+
+    def update_users(self, qq_numbers: List[str], fields: Dict[str, Any], chunk_size: int = 500) -> int:
+        """在同一事务内批量合并更新多个用户的部分字段，只提交一次
+
+        Returns:
+            int: 实际更新的用户数，不存在或字段已是目标值的用户会被跳过
+        """
+        updated = 0
+        with self.transaction():
+            for i in range(0, len(qq_numbers), chunk_size):
+                chunk = qq_numbers[i:i + chunk_size]
+                rows = []
+                for qq_number, record in self._peek_users(chunk).items():
+                    if all(record.get(key) == value for key, value in fields.items()):
+                        self._stats["skipped_writes"] += 1
+                        continue
+                    record.update(fields)
+                    data = json.dumps(record, ensure_ascii=False)
+                    rows.append((qq_number, data))
+                    self._log_change("user", "", qq_number)
+                    # 只更新已在工作集里的记录，批量操作不挤占活跃用户
+                    if ("user", qq_number) in self._cache:
+                        self._cache_put(("user", qq_number), record, len(data))
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO user_info (qq_number, data) VALUES (?, ?)", rows
+                )
+                self._stats["writes"] += len(rows)
+                updated += len(rows)
+        return updated
+
+    def delete_user(self, qq_number: str):
+        """删除用户信息及其在各群的成员信息"""
+        with self.transaction():
+            self._conn.execute("DELETE FROM user_info WHERE qq_number = ?", (qq_number,))
+            self._log_change("user", "", qq_number)
+            self._cache_drop(("user", qq_number))
+            self.delete_user_memberships(qq_number)
+
+    # ---------- 群成员信息 ----------
+
+    def get_member(self, group_id: str, qq_number: str) -> Optional[Dict[str, Any]]:
+        """获取群成员信息，返回副本"""
+        self._maybe_refresh()
+        key = ("member", group_id, qq_number)
+        record = self._cache_get(key)
+        if record is None:
+            row = self._conn.execute(
+                "SELECT data FROM group_info WHERE group_id = ? AND qq_number = ?",
+                (group_id, qq_number)
+            ).fetchone()
+            if row is None:
+                return None
+            record = json.loads(row[0])
+            self._cache_put(key, record, len(row[0]))
+        return dict(record)
+
+    def get_members(self, group_id: str, qq_numbers: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量获取某群部分成员的信息，工作集未命中的记录用一次查询读回
+
+        Returns:
+            dict: qq_number -> 群成员信息副本，不存在的成员不包含在内
+        """
+        self._maybe_refresh()
+        result = {}
+        missing = []
+        for qq_number in qq_numbers:
+            record = self._cache_get(("member", group_id, qq_number))
+            if record is None:
+                missing.append(qq_number)
+            else:
+                result[qq_number] = dict(record)
+
+        if missing:
+            placeholders = ",".join("?" * len(missing))
+            rows = self._conn.execute(
+                f"SELECT qq_number, data FROM group_info WHERE group_id = ? AND qq_number IN ({placeholders})",
+                [group_id, *missing]
+            ).fetchall()
+            for qq_number, data in rows:
+                record = json.loads(data)
+                self._cache_put(("member", group_id, qq_number), record, len(data))
+                result[qq_number] = dict(record)
+        return result
+
+    def put_member(self, group_id: str, qq_number: str, record: Dict[str, Any]):
+        """写入群成员信息，除最后活跃时间外内容没有变化且活跃时间仍在写入间隔内时跳过"""
+        with self.transaction():
+            entry = self._cache.get(("member", group_id, qq_number))
+            if entry is not None:
+                current = entry[0]
+            else:
+                # 写入前比较用的读取，不计入命中统计
+                row = self._conn.execute(
+                    "SELECT data FROM group_info WHERE group_id = ? AND qq_number = ?",
+                    (group_id, qq_number)
+                ).fetchone()
+                current = json.loads(row[0]) if row is not None else None
+            if current is not None and self._is_same_member(current, record):
+                self._stats["skipped_writes"] += 1
+                return
+            data = json.dumps(record, ensure_ascii=False)
+            self._stats["writes"] += 1
+            self._conn.execute(
+                "INSERT OR REPLACE INTO group_info (group_id, qq_number, data) VALUES (?, ?, ?)",
+                (group_id, qq_number, data)
+            )
+            self._log_change("member", group_id, qq_number)
+            self._cache_put(("member", group_id, qq_number), dict(record), len(data))
+            self._index_add(group_id, qq_number)
+
+    def _member_timestamp_age(self, record: Dict[str, Any], now: datetime) -> Optional[float]:
+        """群成员最后活跃时间距 now 的秒数，无法解析时返回 None"""
+        try:
+            return (now - datetime.fromisoformat(record["timestamp"])).total_seconds()
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def _is_same_member(self, current: Dict[str, Any], record: Dict[str, Any]) -> bool:
+        """两条群成员记录除最后活跃时间外是否相同，且已存的活跃时间仍在写入间隔内"""
+        if current.keys() != record.keys():
+            return False
+        if any(current[key] != record[key] for key in current if key != "timestamp"):
+            return False
+        if current.get("timestamp") == record.get("timestamp"):
+            return True
+        try:
+            now = datetime.fromisoformat(record["timestamp"])
+        except (KeyError, TypeError, ValueError):
+            return False
+        age = self._member_timestamp_age(current, now)
+        return age is not None and age < self.member_touch_interval
+
+    def is_member_stale(self, record: Optional[Dict[str, Any]]) -> bool:
+        """群成员信息是否需要向协议端重新获取：不存在，或最后刷新时间超过写入间隔"""
+        if record is None:
+            return True
+        age = self._member_timestamp_age(record, datetime.now())
+        return age is None or age >= self.member_touch_interval
+
+    def get_group_members(self, group_id: str) -> Dict[str, Dict[str, Any]]:
+        """获取某群全部成员信息
+
+        整群扫描直接走磁盘层，不把整群成员塞进工作集，避免冲掉活跃用户。
+        """
+        rows = self._conn.execute(
+            "SELECT qq_number, data FROM group_info WHERE group_id = ?", (group_id,)
+        ).fetchall()
+        return {qq_number: json.loads(data) for qq_number, data in rows}
+
+    def list_groups(self) -> List[str]:
+        """列出所有有成员记录的群"""
+        rows = self._conn.execute("SELECT DISTINCT group_id FROM group_info").fetchall()
+        return [row[0] for row in rows]
+
+    def list_group_member_ids(self, group_id: str) -> List[str]:
+        """列出某群所有成员的QQ号，不解析记录内容"""
+        rows = self._conn.execute(
+            "SELECT qq_number FROM group_info WHERE group_id = ?", (group_id,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def scan_member_timestamps(self, after: Optional[Tuple[str, str]], limit: int) -> List[Tuple[str, str, Optional[str]]]:
+        """按 (group_id, qq_number) 顺序分批扫描群成员的最后活跃时间
+
+        Args:
+            after: 上一批最后一条的 (group_id, qq_number)，为 None 时从头开始
+            limit: 本批最多返回的条数
+
+        Returns:
+            list: [(group_id, qq_number, timestamp), ...]
+        """
+        if after is None:
+            rows = self._conn.execute(
+                "SELECT group_id, qq_number, json_extract(data, '$.timestamp') FROM group_info "
+                "ORDER BY group_id, qq_number LIMIT ?",
+                (limit,)
+            ).fetchall()
+        else:
+            rows = self._conn.execute(
+                "SELECT group_id, qq_number, json_extract(data, '$.timestamp') FROM group_info "
+                "WHERE (group_id, qq_number) > (?, ?) ORDER BY group_id, qq_number LIMIT ?",
+                (after[0], after[1], limit)
+            ).fetchall()
+        return rows
+
+    def delete_members(self, keys: List[Tuple[str, str]], keep_activity: bool = False):
+        """批量删除群成员信息，一次提交
+
+        Args:
+            keys: [(group_id, qq_number), ...]
+            keep_activity: 是否保留发言计数
+        """
+        if not keys:
+            return
+        with self.transaction():
+            self._conn.executemany(
+                "DELETE FROM group_info WHERE group_id = ? AND qq_number = ?", keys
+            )
+            if not keep_activity:
+                self._conn.executemany(
+                    "DELETE FROM activity WHERE group_id = ? AND qq_number = ?", keys
+                )
+            for group_id, qq_number in keys:
+                self._log_change("member", group_id, qq_number)
+                self._cache_drop(("member", group_id, qq_number))
+                self._index_remove(group_id, qq_number)
+                if not keep_activity:
+                    self._pending_activity.pop((group_id, qq_number), None)
+                    self._log_change("activity", group_id, qq_number)
+                    self._cache_drop(("activity", group_id, qq_number))
+
+    def delete_group(self, group_id: str):
+        """删除整个群的成员信息"""
+        with self.transaction():
+            qq_numbers = self.list_group_member_ids(group_id)
+            self._conn.execute("DELETE FROM group_info WHERE group_id = ?", (group_id,))
+            self._conn.execute("DELETE FROM activity WHERE group_id = ?", (group_id,))
+            self._log_change("group", group_id)
+            for key in [key for key in self._pending_activity if key[0] == group_id]:
+                del self._pending_activity[key]
+            for qq_number in qq_numbers:
+                self._cache_drop(("member", group_id, qq_number))
+                self._cache_drop(("activity", group_id, qq_number))
+                self._index_remove(group_id, qq_number)
+
+    def get_user_groups(self, qq_number: str) -> Set[str]:
+        """获取用户所在的群号集合（返回副本）"""
+        self._maybe_refresh()
+        return set(self._user_groups.get(qq_number, ()))
+
+    def delete_user_memberships(self, qq_number: str, keep_activity: bool = False) -> int:
+        """删除用户在所有群的成员信息，只触及反向索引中记录的群
+
+        Args:
+            keep_activity: 是否保留发言计数
+
+        Returns:
+            int: 删除的记录数
+        """
+        with self.transaction():
+            keys = [(group_id, qq_number) for group_id in self.get_user_groups(qq_number)]
+            self.delete_members(keys, keep_activity=keep_activity)
+        return len(keys)
+
+    # ---------- 导入导出 ----------
+
+    @contextmanager
+    def read_snapshot(self) -> Iterator[sqlite3.Connection]:
+        """打开独立的数据库连接并开启读事务，期间读到的是同一时刻的快照
+
+        返回的连接只能在创建它的线程中使用，可用于在后台线程中读取大量数据而不占用主连接。
+        """
+        conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN")
+            yield conn
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def iter_user_rows(self, conn: Optional[sqlite3.Connection] = None) -> Iterator[Tuple[str, str]]:
+        """按QQ号顺序逐行读出用户信息的 (qq_number, 序列化数据)，不经过工作集
+
+        Args:
+            conn: 使用的数据库连接，默认为主连接
+        """
+        yield from (conn or self._conn).execute("SELECT qq_number, data FROM user_info ORDER BY qq_number")
+
+    def iter_member_rows(self, conn: Optional[sqlite3.Connection] = None) -> Iterator[Tuple[str, str, str]]:
+        """按 (group_id, qq_number) 顺序逐行读出群成员信息的 (group_id, qq_number, 序列化数据)"""
+        yield from (conn or self._conn).execute(
+            "SELECT group_id, qq_number, data FROM group_info ORDER BY group_id, qq_number"
+        )
+
+    def export_jsonl(self, path: str) -> Tuple[int, int]:
+        """以 JSONL 格式流式导出全部用户信息和群成员信息，逐行读取、逐行写入
+
+        使用独立连接的读快照，不占用主连接，可以在后台线程中调用。
+        每行为 {"type": "user", "qq_number": ..., "data": {...}} 或
+        {"type": "member", "group_id": ..., "qq_number": ..., "data": {...}}
+
+        Returns:
+            tuple: (用户数, 群成员数)
+        """
+        user_count = 0
+        member_count = 0
+        tmp_path = f"{path}.tmp"
+        with self.read_snapshot() as conn, open(tmp_path, 'w', encoding='utf-8') as f:
+            for qq_number, data in self.iter_user_rows(conn):
+                f.write(f'{{"type": "user", "qq_number": {json.dumps(qq_number)}, "data": {data}}}\n')
+                user_count += 1
+            for group_id, qq_number, data in self.iter_member_rows(conn):
+                f.write(
+                    f'{{"type": "member", "group_id": {json.dumps(group_id)}, '
+                    f'"qq_number": {json.dumps(qq_number)}, "data": {data}}}\n'
+                )
+                member_count += 1
+        os.replace(tmp_path, path)
+        return user_count, member_count
+
+    @staticmethod
+    def _iter_jsonl_entries(path: str) -> Iterator[Tuple[str, str, str, str]]:
+        """逐行解析 JSONL 导入文件，产出 (类型, group_id, qq_number, 序列化数据)，格式错误时抛出 ValueError"""
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                    kind = entry["type"]
+                    qq_number = str(entry["qq_number"])
+                    if not isinstance(entry["data"], dict):
+                        raise TypeError("data 必须是对象")
+                    data = json.dumps(entry["data"], ensure_ascii=False)
+                except (ValueError, KeyError, TypeError) as e:
+                    raise ValueError(f"第 {line_no} 行格式错误: {e}")
+
+                if kind == "user":
+                    yield kind, "", qq_number, data
+                elif kind == "member":
+                    group_id = str(entry.get("group_id", ""))
+                    if not group_id:
+                        raise ValueError(f"第 {line_no} 行缺少 group_id")
+                    yield kind, group_id, qq_number, data
+                else:
+                    raise ValueError(f"第 {line_no} 行类型未知: {kind}")
+
+    @classmethod
+    def validate_jsonl(cls, path: str) -> Tuple[int, int]:
+        """校验整个导入文件的格式，不访问数据库，可以在后台线程中调用
+
+        Returns:
+            tuple: (用户数, 群成员数)
+        """
+        user_count = 0
+        member_count = 0
+        for kind, _, _, _ in cls._iter_jsonl_entries(path):
+            if kind == "user":
+                user_count += 1
+            else:
+                member_count += 1
+        return user_count, member_count
+
+    def import_jsonl_batches(self, path: str, batch_size: int = 500) -> Iterator[Tuple[int, int]]:
+        """从 JSONL 文件流式导入，逐行读取，每批在单独的事务中提交
+
+        每提交一批产出一次累计的 (用户数, 群成员数)，调用方可以在批次之间让出事件循环，
+        写锁只在单批写入期间持有。已存在的记录会被覆盖；导入前应先调用 validate_jsonl 校验，
+        否则格式错误之前的批次已经提交。
+        """
+        user_count = 0
+        member_count = 0
+        user_rows = []
+        member_rows = []
+
+        def flush():
+            with self.transaction():
+                if user_rows:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO user_info (qq_number, data) VALUES (?, ?)", user_rows
+                    )
+                if member_rows:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO group_info (group_id, qq_number, data) VALUES (?, ?, ?)", member_rows
+                    )
+                for qq_number, _ in user_rows:
+                    self._cache_drop(("user", qq_number))
+                for group_id, qq_number, _ in member_rows:
+                    self._cache_drop(("member", group_id, qq_number))
+                    self._index_add(group_id, qq_number)
+                # 批量导入不逐条记录变更，让其他进程整体失效重建
+                self._log_change("reset")
+            user_rows.clear()
+            member_rows.clear()
+
+        for kind, group_id, qq_number, data in self._iter_jsonl_entries(path):
+            if kind == "user":
+                user_rows.append((qq_number, data))
+                user_count += 1
+            else:
+                member_rows.append((group_id, qq_number, data))
+                member_count += 1
+            if len(user_rows) + len(member_rows) >= batch_size:
+                flush()
+                yield user_count, member_count
+        if user_rows or member_rows:
+            flush()
+        yield user_count, member_count
+
+    # ---------- 发言计数 ----------
+
+    def _read_activity_row(self, group_id: str, qq_number: str) -> Optional[ActivityCounter]:
+        row = self._conn.execute(
+            "SELECT last_hour, last_day, hourly, daily FROM activity WHERE group_id = ? AND qq_number = ?",
+            (group_id, qq_number)
+        ).fetchone()
+        return ActivityCounter.from_row(*row) if row is not None else None
+
+    @staticmethod
+    def _apply_pending_activity(counter: ActivityCounter, pending: Dict[int, int]):
+        for hour in sorted(pending):
+            counter.record(hour * 3600, pending[hour])
+
+    def _load_activity(self, group_id: str, qq_number: str) -> Optional[ActivityCounter]:
+        """读取发言计数器，从磁盘层读回时叠加尚未写入的发言计数"""
+        self._maybe_refresh()
+        key = ("activity", group_id, qq_number)
+        counter = self._cache_get(key)
+        if counter is None:
+            counter = self._read_activity_row(group_id, qq_number)
+            pending = self._pending_activity.get((group_id, qq_number))
+            if pending:
+                counter = counter or ActivityCounter()
+                self._apply_pending_activity(counter, pending)
+            if counter is None:
+                return None
+            self._cache_put(key, counter, counter.nbytes())
+        return counter
+
+    def record_activity(self, group_id: str, qq_number: str, timestamp: Optional[float] = None):
+        """记录一次群成员发言
+
+        只更新内存中的计数器并记入待写入计数，由 flush_activity 定期批量写入磁盘层。
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        counter = self._load_activity(group_id, qq_number)
+        if counter is None:
+            counter = ActivityCounter()
+            self._cache_put(("activity", group_id, qq_number), counter, counter.nbytes())
+        counter.record(timestamp)
+        pending = self._pending_activity.setdefault((group_id, qq_number), {})
+        hour = int(timestamp // 3600)
+        pending[hour] = pending.get(hour, 0) + 1
+        self._notify("activity", group_id, qq_number)
+
+    def flush_activity(self) -> int:
+        """把累积的发言计数在一个事务内写入磁盘层
+
+        在事务内重新读取磁盘层的计数再叠加本进程的增量，共享模式下不会覆盖其他进程写入的计数。
+
+        Returns:
+            int: 写入的计数器数
+        """
+        if not self._pending_activity:
+            return 0
+        pending_activity = self._pending_activity
+        rows = []
+        with self.transaction():
+            for (group_id, qq_number), pending in pending_activity.items():
+                counter = self._read_activity_row(group_id, qq_number) or ActivityCounter()
+                self._apply_pending_activity(counter, pending)
+                rows.append((group_id, qq_number, *counter.to_row()))
+                self._cache_put(("activity", group_id, qq_number), counter, counter.nbytes())
+                if self.shared:
+                    self._pending_changes.append(("activity", group_id, qq_number))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO activity (group_id, qq_number, last_hour, last_day, hourly, daily) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._stats["writes"] += len(rows)
+        # 写入期间没有新的发言计数（同一事件循环内同步执行），可以整体清空
+        self._pending_activity = {}
+        return len(rows)
+
+    def get_activity(self, group_id: str, qq_number: str, hours: int) -> int:
+        """群成员最近 hours 小时的发言数"""
+        counter = self._load_activity(group_id, qq_number)
+        return counter.count(hours) if counter is not None else 0
+
+    def get_group_activity(self, group_id: str, hours: int) -> Dict[str, int]:
+        """某群所有成员最近 hours 小时的发言数，整群扫描直接走磁盘层，再叠加尚未写入的计数"""
+        rows = self._conn.execute(
+            "SELECT qq_number, last_hour, last_day, hourly, daily FROM activity WHERE group_id = ?",
+            (group_id,)
+        ).fetchall()
+        counts = {row[0]: ActivityCounter.from_row(*row[1:]).count(hours) for row in rows}
+        for pending_group_id, qq_number in list(self._pending_activity):
+            if pending_group_id == group_id:
+                counts[qq_number] = self.get_activity(group_id, qq_number, hours)
+        return counts
+
+    def get_most_active_members(self, group_id: str, hours: int = 24, limit: int = 10) -> List[Tuple[str, int]]:
+        """某群最近 hours 小时发言最多的成员
+
+        Returns:
+            list: [(qq_number, 发言数), ...]，按发言数降序
+        """
+        counts = self.get_group_activity(group_id, hours)
+        ranked = sorted(
+            ((qq_number, count) for qq_number, count in counts.items() if count > 0),
+            key=lambda item: item[1],
+            reverse=True
+        )
+        return ranked[:limit]
+
+    def close(self):
+        """写入尚未保存的发言计数并关闭数据库连接"""
+        try:
+            self.flush_activity()
+        except Exception as e:
+            logger.error(f"保存发言计数失败: {e}")
+        try:
+            self._conn.close()
+        except Exception as e:
+            logger.error(f"关闭信息数据库失败: {e}")
@@ -0,0 +1,75 @@
+import importlib
+import importlib.util
+import logging
+import os
+import sys
+import types
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_NAME = "astrbot_plugin_azusaimp"
+
+
+class _StubFilter:
+    """astrbot.api.event.filter 的替身，所有装饰器都原样返回被装饰的函数"""
+
+    class PermissionType:
+        ADMIN = "admin"
+        MEMBER = "member"
+
+    @staticmethod
+    def _decorator(*args, **kwargs):
+        def wrap(fn):
+            return fn
+        return wrap
+
+    def command_group(self, *args, **kwargs):
+        def wrap(fn):
+            fn.command = self._decorator
+            fn.group = self.command_group
+            return fn
+        return wrap
+
+    def __getattr__(self, name):
+        return self._decorator
+
+
+def install_astrbot_stub():
+    """未安装 AstrBot 时注册最小的 astrbot.api 替身模块，只提供插件导入时用到的名字"""
+    if "astrbot" in sys.modules or importlib.util.find_spec("astrbot") is not None:
+        return
+
+    def module(name, **attrs):
+        mod = types.ModuleType(name)
+        mod.__path__ = []
+        mod.__dict__.update(attrs)
+        sys.modules[name] = mod
+        return mod
+
+    class Star:
+        def __init__(self, context):
+            self.context = context
+
+    class Placeholder:
+        def __init__(self, *args, **kwargs):
+            pass
+
+    class At:
+        def __init__(self, qq):
+            self.qq = qq
+
+    module("astrbot")
+    module("astrbot.api", logger=logging.getLogger("astrbot"), AstrBotConfig=dict)
+    module("astrbot.api.event", filter=_StubFilter(), AstrMessageEvent=Placeholder, MessageEventResult=Placeholder)
+    module("astrbot.api.star", Context=Placeholder, Star=Star, register=lambda *args, **kwargs: (lambda cls: cls))
+    module("astrbot.api.provider", ProviderRequest=Placeholder, LLMResponse=Placeholder)
+    module("astrbot.api.message_components", At=At)
+
+
+def import_plugin_module(name: str):
+    """以包的形式导入插件模块，插件内部使用相对导入"""
+    install_astrbot_stub()
+    if PACKAGE_NAME not in sys.modules:
+        package = types.ModuleType(PACKAGE_NAME)
+        package.__path__ = [PLUGIN_DIR]
+        sys.modules[PACKAGE_NAME] = package
+    return importlib.import_module(f"{PACKAGE_NAME}.{name}")
@@ -0,0 +1,110 @@
+import asyncio
+
+from helpers import import_plugin_module
+
+AzusaImp = import_plugin_module("main").AzusaImp
+
+
+class StubResponse:
+    def __init__(self, completion_text: str):
+        self.completion_text = completion_text
+
+
+class StubProvider:
+    """本地替身，按顺序返回预设的整理结果，并记录收到的提示词"""
+
+    def __init__(self, replies, on_call=None):
+        self.replies = list(replies)
+        self.prompts = []
+        self.on_call = on_call
+
+    async def text_chat(self, prompt, contexts, system_prompt):
+        self.prompts.append(prompt)
+        if self.on_call is not None:
+            self.on_call()
+        return StubResponse(self.replies.pop(0))
+
+
+class StubContext:
+    def __init__(self, provider):
+        self.provider = provider
+
+    def get_using_provider(self):
+        return self.provider
+
+    def get_provider_by_id(self, provider_id):
+        return self.provider
+
+
+def run_with_plugin(tmp_path, monkeypatch, provider, test, **config):
+    """在事件循环中创建插件实例并执行 test(plugin)，结束后卸载插件"""
+    monkeypatch.chdir(tmp_path)
+    config = {"consolidation_max_chars": 10, **config}
+
+    async def main():
+        plugin = AzusaImp(StubContext(provider), config)
+        try:
+            return await test(plugin)
+        finally:
+            await plugin.terminate()
+
+    return asyncio.run(main())
+
+
+def test_find_fields_to_consolidate(tmp_path, monkeypatch):
+    async def test(plugin):
+        return plugin.find_fields_to_consolidate({
+            "relationship": "朋友",
+            "impression": "这是一段明显超过十个字的印象描述",
+            "attitude": "友好，热情，友好",
+            "interest": "这个字段不在整理范围内，再长也不处理"
+        })
+
+    assert run_with_plugin(tmp_path, monkeypatch, StubProvider([]), test) == ["impression", "attitude"]
+
+
+def test_consolidate_user_fields_writes_summary(tmp_path, monkeypatch):
+    provider = StubProvider(["  简短的印象  "])
+
+    async def test(plugin):
+        plugin.store.put_user("10000", {"qq_number": "10000", "impression": "很长的印象，很长的印象，很长的印象"})
+        updated = await plugin.consolidate_user_fields("10000", ["impression"])
+        return updated, plugin.store.get_user("10000")
+
+    updated, user = run_with_plugin(tmp_path, monkeypatch, provider, test)
+    assert updated == {"impression": "简短的印象"}
+    assert user["impression"] == "简短的印象"
+    assert "很长的印象，很长的印象，很长的印象" in provider.prompts[0]
+
+
+def test_consolidate_user_fields_skips_over_length_reply(tmp_path, monkeypatch):
+    provider = StubProvider(["整理后的印象描述仍然超过了长度上限"])
+
+    async def test(plugin):
+        plugin.store.put_user("10000", {"qq_number": "10000", "impression": "很长的印象，很长的印象，很长的印象"})
+        updated = await plugin.consolidate_user_fields("10000", ["impression"])
+        return updated, plugin.store.get_user("10000")
+
+    updated, user = run_with_plugin(tmp_path, monkeypatch, provider, test)
+    assert updated == {}
+    assert user["impression"] == "很长的印象，很长的印象，很长的印象"
+
+
+def test_consolidate_user_fields_skips_field_changed_during_call(tmp_path, monkeypatch):
+    plugin_ref = {}
+
+    def change_field():
+        # 模拟LLM调用期间对话钩子更新了该字段
+        plugin_ref["plugin"].store.update_user("10000", {"impression": "新的印象"})
+
+    provider = StubProvider(["整理结果"], on_call=change_field)
+
+    async def test(plugin):
+        plugin_ref["plugin"] = plugin
+        plugin.store.put_user("10000", {"qq_number": "10000", "impression": "旧的印象，旧的印象"})
+        updated = await plugin.consolidate_user_fields("10000", ["impression"])
+        return updated, plugin.store.get_user("10000")
+
+    updated, user = run_with_plugin(tmp_path, monkeypatch, provider, test)
+    assert updated == {}
+    assert user["impression"] == "新的印象"
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import os
+
+from helpers import import_plugin_module
+
+ProfileStore = import_plugin_module("profile_store").ProfileStore
+JsonMirror = import_plugin_module("json_mirror").JsonMirror
+
+
+def make_mirror(tmp_path):
+    store = ProfileStore(str(tmp_path))
+    mirror = JsonMirror(store, str(tmp_path / "user_info.json"), str(tmp_path / "group_info.json"))
+    return store, mirror
+
+
+def read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def test_stale_buffer_only_merges_edited_records(tmp_path):
+    async def main():
+        store, mirror = make_mirror(tmp_path)
+        store.put_user("2", {"nickname": "b", "impression": "旧印象"})
+        store.put_user("3", {"nickname": "c"})
+        await mirror.check()
+        await mirror.flush()
+
+        # 管理员打开文件后，对话中更新了用户 2 的印象并写出了新镜像
+        buffer = read_json(mirror.user_file)
+        store.update_user("2", {"impression": "新印象"})
+        await mirror.flush()
+
+        # 管理员只改了用户 3，用旧缓冲区保存
+        buffer["3"]["nickname"] = "改过的昵称"
+        write_json(mirror.user_file, buffer)
+        merged = await mirror.check()
+        result = store.get_user("2"), store.get_user("3"), merged
+        store.close()
+        return result
+
+    user_2, user_3, merged = asyncio.run(main())
+    assert merged == 1
+    assert user_2["impression"] == "新印象"
+    assert user_3["nickname"] == "改过的昵称"
+
+
+def test_merge_only_applies_edited_fields(tmp_path):
+    async def main():
+        store, mirror = make_mirror(tmp_path)
+        store.put_member("100", "2", {"card": "旧名片", "title": ""})
+        await mirror.check()
+        await mirror.flush()
+
+        buffer = read_json(mirror.group_file)
+        store.put_member("100", "2", {"card": "新名片", "title": ""})
+        buffer["100"]["2"]["title"] = "头衔"
+        write_json(mirror.group_file, buffer)
+        await mirror.check()
+        result = store.get_member("100", "2")
+        store.close()
+        return result
+
+    assert asyncio.run(main()) == {"card": "新名片", "title": "头衔"}
+
+
+def test_broken_file_is_not_overwritten(tmp_path):
+    async def main():
+        store, mirror = make_mirror(tmp_path)
+        store.put_user("2", {"nickname": "b"})
+        await mirror.check()
+        await mirror.flush()
+
+        with open(mirror.user_file, 'w', encoding='utf-8') as f:
+            f.write("{broken")
+        await mirror.check()
+        store.put_user("2", {"nickname": "bb"})
+        await mirror.flush()
+        with open(mirror.user_file, 'r', encoding='utf-8') as f:
+            content = f.read()
+        store.close()
+        return content
+
+    assert asyncio.run(main()) == "{broken"
+
+
+def test_file_without_base_is_set_aside(tmp_path):
+    async def main():
+        store, mirror = make_mirror(tmp_path)
+        store.put_user("2", {"nickname": "b"})
+        await mirror.check()
+        await mirror.flush()
+
+        write_json(mirror.user_file, {"2": {"nickname": "不知道基于哪个版本"}})
+        await mirror.check()
+        await mirror.flush()
+        result = store.get_user("2"), read_json(mirror.user_file), os.path.exists(f"{mirror.user_file}.rejected")
+        store.close()
+        return result
+
+    user, mirrored, rejected = asyncio.run(main())
+    assert user == {"nickname": "b"}
+    assert mirrored["2"] == {"nickname": "b"}
+    assert rejected
+
+
+def test_flush_only_rewrites_changed_file(tmp_path):
+    async def main():
+        store, mirror = make_mirror(tmp_path)
+        store.put_user("2", {"nickname": "b"})
+        store.put_member("100", "2", {"card": "旧名片"})
+        await mirror.check()
+        await mirror.flush()
+        user_stat = os.stat(mirror.user_file).st_mtime_ns
+
+        store.put_member("100", "2", {"card": "新名片"})
+        await mirror.flush()
+        result = os.stat(mirror.user_file).st_mtime_ns, read_json(mirror.group_file)["100"]["2"]
+        store.close()
+        return user_stat, result
+
+    user_stat, (new_user_stat, member) = asyncio.run(main())
+    assert new_user_stat == user_stat
+    assert member == {"card": "新名片"}
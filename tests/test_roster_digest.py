@@ -0,0 +1,51 @@
+import asyncio
+import json
+
+from helpers import import_plugin_module
+
+AzusaImp = import_plugin_module("main").AzusaImp
+
+
+def run_with_plugin(tmp_path, monkeypatch, test):
+    monkeypatch.chdir(tmp_path)
+
+    async def main():
+        plugin = AzusaImp(None, {})
+        try:
+            return await test(plugin)
+        finally:
+            await plugin.terminate()
+
+    return asyncio.run(main())
+
+
+def test_activity_does_not_invalidate_cached_roster(tmp_path, monkeypatch):
+    async def test(plugin):
+        for qq_number in ("1", "2"):
+            plugin.store.put_user(qq_number, {"nickname": f"用户{qq_number}"})
+            plugin.store.put_member("100", qq_number, {"display_name": ""})
+        members_json = plugin.get_roster_digest("100")["members_json"]
+        for _ in range(3):
+            plugin.store.record_activity("100", "1")
+            assert plugin.get_roster_digest("100")["members_json"] is members_json
+        return members_json
+
+    members = json.loads(run_with_plugin(tmp_path, monkeypatch, test))
+    assert len(members) == 2
+
+
+def test_profile_change_only_rerenders_changed_member(tmp_path, monkeypatch):
+    async def test(plugin):
+        for qq_number in ("1", "2"):
+            plugin.store.put_user(qq_number, {"nickname": f"用户{qq_number}"})
+            plugin.store.put_member("100", qq_number, {"display_name": ""})
+        digest = plugin.get_roster_digest("100")
+        unchanged = digest["members"]["2"]
+        plugin.store.update_user("1", {"impression": "新的印象"})
+        digest = plugin.get_roster_digest("100")
+        return digest, unchanged
+
+    digest, unchanged = run_with_plugin(tmp_path, monkeypatch, test)
+    assert digest["members"]["2"] is unchanged
+    assert "新的印象" in digest["members"]["1"]
+    assert len(json.loads(digest["members_json"])) == 2
@@ -0,0 +1,49 @@
+import multiprocessing
+
+from helpers import import_plugin_module
+
+ProfileStore = import_plugin_module("profile_store").ProfileStore
+
+PROCESSES = 6
+ITERATIONS = 100
+
+
+def worker(data_dir: str, index: int):
+    store = ProfileStore(data_dir, max_records=50, shared=True)
+    for i in range(ITERATIONS):
+        store.update_user("10000", {f"field_{index}_{i}": i})
+        store.record_activity("20000", "10000")
+        store.put_member("20000", f"{index}_{i}", {"card": str(i)})
+        if i % 10 == 0:
+            store.flush_activity()
+    store.close()
+
+
+def test_concurrent_writers_do_not_lose_updates(tmp_path):
+    data_dir = str(tmp_path)
+    store = ProfileStore(data_dir, shared=True)
+    store.put_user("10000", {"qq_number": "10000"})
+
+    processes = [
+        multiprocessing.Process(target=worker, args=(data_dir, index))
+        for index in range(PROCESSES)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    user = store.get_user("10000")
+    for index in range(PROCESSES):
+        for i in range(ITERATIONS):
+            assert user[f"field_{index}_{i}"] == i
+
+    assert store.get_activity("20000", "10000", 24) == PROCESSES * ITERATIONS
+
+    member_ids = set(store.list_group_member_ids("20000"))
+    expected = {f"{index}_{i}" for index in range(PROCESSES) for i in range(ITERATIONS)}
+    assert member_ids == expected
+    # 反向索引同步了其他进程新增的群成员
+    assert all(store.get_user_groups(qq_number) == {"20000"} for qq_number in expected)
+    store.close()